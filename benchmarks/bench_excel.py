@@ -0,0 +1,78 @@
+"""
+xlsx读写性能对比：在临时目录生成一张PTA风格的成绩表，分别计时
+表头读取、整表读取、保存三个环节的原做法（pandas默认）和 score_engine 的做法
+
+示例：
+    python benchmarks/bench_excel.py
+    python benchmarks/bench_excel.py --rows 50000 --problems 10
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from score_engine import (  # noqa: E402
+    EXCEL_READ_ENGINE, EXCEL_WRITE_ENGINE, read_excel_columns, read_excel_sheet, write_excel_sheet,
+)
+
+
+def make_sheet(rows, problems, seed=0):
+    """生成PTA风格的成绩表：排名/姓名/学号/总分(满分)/各题得分"""
+    rng = np.random.default_rng(seed)
+    full_score = problems * 10
+    df = pd.DataFrame({
+        "排名": np.arange(1, rows + 1),
+        "姓名": [f"学生{i}" for i in range(rows)],
+        "学号": [f"2023{i:08d}" for i in range(rows)],
+        f"总分({full_score})": rng.integers(0, full_score + 1, rows),
+    })
+    for i in range(problems):
+        df[str(i + 1)] = rng.integers(0, 11, rows)
+    return df
+
+
+def timed(func, repeat):
+    """运行repeat次，返回最快一次的耗时（秒）"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="xlsx读写性能对比")
+    parser.add_argument("--rows", type=int, default=50000, help="成绩表行数（默认50000）")
+    parser.add_argument("--problems", type=int, default=10, help="题目列数（默认10）")
+    parser.add_argument("--repeat", type=int, default=1, help="每项重复次数，取最快一次（默认1）")
+    args = parser.parse_args(argv)
+
+    df = make_sheet(args.rows, args.problems)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "成绩.xlsx")
+        df.to_excel(path, index=False)
+        print(f"{args.rows}行 x {len(df.columns)}列，读取引擎：{EXCEL_READ_ENGINE}，写入引擎：{EXCEL_WRITE_ENGINE}")
+
+        cases = [
+            ("读表头", lambda: pd.read_excel(path, nrows=0), lambda: read_excel_columns(path)),
+            ("读整表", lambda: pd.read_excel(path), lambda: read_excel_sheet(path)),
+            ("保存", lambda: df.to_excel(os.path.join(tmp, "a.xlsx"), index=False),
+             lambda: write_excel_sheet(df, os.path.join(tmp, "b.xlsx"))),
+        ]
+        print(f"{'环节':<6}{'pandas默认(秒)':>16}{'score_engine(秒)':>18}{'加速比':>8}")
+        for name, baseline, fast in cases:
+            before, after = timed(baseline, args.repeat), timed(fast, args.repeat)
+            print(f"{name:<6}{before:>16.3f}{after:>18.3f}{before / after:>8.1f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,119 @@
+"""
+生成模拟的PTA成绩单，用于性能测试
+表头与PTA导出一致：姓名/学号列没有列名（读取后为Unnamed: 1/Unnamed: 2），总分列为「总分(满分)」，后面是每题得分；
+总分中按比例混入「缺考」「未开考」，学号保留前导0，支持GBK/utf-8-sig编码的CSV和xlsx
+
+示例：
+    python benchmarks/gen_gradebook.py 输出文件夹 --rows 10000 --files 3
+    python benchmarks/gen_gradebook.py 输出文件夹 --rows 1000 --format xlsx
+"""
+import argparse
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+FAMILY_NAMES = "赵钱孙李周吴郑王冯陈褚卫蒋沈韩杨朱秦尤许何吕施张孔曹严华金魏陶姜"
+GIVEN_NAMES = "伟芳娜敏静丽强磊军洋勇艳杰娟涛明超秀霞平刚桂英华玉兰萍红"
+FORMATS = {"csv-gbk": ("csv", "gbk"), "csv-utf-8-sig": ("csv", "utf-8-sig"), "xlsx": ("xlsx", "")}
+
+
+def make_roster(rows, seed=0):
+    """生成学生名单：(姓名, 学号)两个Series，学号为带前导0的10位文本"""
+    rng = np.random.default_rng(seed)
+    family = np.array(list(FAMILY_NAMES))[rng.integers(0, len(FAMILY_NAMES), rows)]
+    given = np.array(list(GIVEN_NAMES))[rng.integers(0, len(GIVEN_NAMES), (rows, 2))]
+    names = pd.Series(family).str.cat([pd.Series(given[:, 0]), pd.Series(given[:, 1])])
+    student_ids = pd.Series(rng.permutation(rows) + 1).map("{:010d}".format)
+    return names, student_ids
+
+
+def make_gradebook(rows, problems=20, full_score=80, absent_rate=0.03, seed=0, roster=None):
+    """
+    生成一份成绩单的表头和数据
+    :param roster: make_roster生成的学生名单，为None时按seed生成；多份成绩单共用一份名单，只有成绩和排名不同
+    :return: (表头列表, DataFrame)，表头中的空字符串对应PTA导出中没有列名的列，数据全部为文本
+    """
+    names, student_ids = roster if roster is not None else make_roster(rows, seed)
+    rng = np.random.default_rng(seed)
+
+    # 每题满分相同，总分为各题得分之和（带小数的题目分）
+    problem_scores = rng.integers(0, 9, (rows, problems)) * (full_score / problems / 8)
+    totals = problem_scores.sum(axis=1)
+    total_text = pd.Series(np.round(totals, 1)).map("{:g}".format)
+    absent = rng.random(rows) < absent_rate
+    total_text[absent] = rng.choice(["缺考", "未开考"], absent.sum())
+
+    order = np.argsort(-np.where(absent, -1, totals), kind="stable")
+    data = {
+        "排名": pd.Series(np.arange(1, rows + 1)).astype(str),
+        "姓名": names[order].reset_index(drop=True),
+        "学号": student_ids[order].reset_index(drop=True),
+        "班级": pd.Series(rng.integers(1, 9, rows)).map("软件{}班".format)[order].reset_index(drop=True),
+        "总分": total_text[order].reset_index(drop=True),
+    }
+    problem_text = pd.DataFrame(np.round(problem_scores[order], 1)).map("{:g}".format)
+    problem_text[absent[order]] = "-"
+    for i in range(problems):
+        data[f"题目{i + 1}"] = problem_text[i]
+    header = ["排名", "", "", "班级", f"总分({full_score:g})"] + [str(i + 1) for i in range(problems)]
+    return header, pd.DataFrame(data)
+
+
+def write_gradebook(header, df, file_path, encoding="utf-8-sig"):
+    """
+    按PTA导出的格式保存：CSV按指定编码写出；xlsx中没有列名的表头单元格留空，
+    姓名/学号/班级为文本单元格，其余能转成数字的为数字单元格
+    """
+    if file_path.endswith('.csv'):
+        with open(file_path, 'w', encoding=encoding, newline='') as f:
+            f.write(','.join(header) + '\n')
+            df.to_csv(f, header=False, index=False)
+        return
+    from openpyxl import Workbook
+
+    numbers = df.drop(columns=["姓名", "学号", "班级"]).apply(pd.to_numeric, errors='coerce')
+    cells = df.astype(object)
+    cells[numbers.columns] = numbers.astype(object).where(numbers.notna(), df[numbers.columns])
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("Sheet1")
+    sheet.append([name or None for name in header])
+    for row in cells.itertuples(index=False, name=None):
+        sheet.append(row)
+    workbook.save(file_path)
+
+
+def generate_files(folder, rows, files=1, file_format="csv-utf-8-sig", problems=20, full_score=80, seed=0):
+    """在folder中生成files份成绩单（作业1、作业2……，学生相同、成绩不同），返回文件路径列表"""
+    extension, encoding = FORMATS[file_format]
+    os.makedirs(folder, exist_ok=True)
+    roster = make_roster(rows, seed)
+    paths = []
+    for index in range(files):
+        header, df = make_gradebook(rows, problems, full_score, seed=seed + index, roster=roster)
+        path = os.path.join(folder, f"作业{index + 1}.{extension}")
+        write_gradebook(header, df, path, encoding)
+        paths.append(path)
+    return paths
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="生成模拟的PTA成绩单")
+    parser.add_argument("folder", help="输出文件夹")
+    parser.add_argument("--rows", type=int, default=1000, help="每份成绩单的学生数（默认1000）")
+    parser.add_argument("--files", type=int, default=1, help="成绩单份数（默认1）")
+    parser.add_argument("--format", choices=sorted(FORMATS), default="csv-utf-8-sig", help="文件格式和编码")
+    parser.add_argument("--problems", type=int, default=20, help="题目数（默认20）")
+    parser.add_argument("--full-score", type=float, default=80, help="满分（默认80）")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子")
+    args = parser.parse_args(argv)
+
+    for path in generate_files(args.folder, args.rows, args.files, args.format, args.problems, args.full_score,
+                               args.seed):
+        print(path)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,278 @@
+"""
+性能基准测试：用模拟的PTA成绩单（见gen_gradebook.py）分环节计时，结果保存为JSON，便于比较不同版本
+不依赖图形界面，可在没有显示器的服务器上运行
+
+计时的环节（每个环节为该规模下所有文件的耗时之和）：
+    read_columns        只读表头
+    try_read_csv        完整读取CSV（xlsx为read_excel_sheet），CSV解析引擎为auto（装有pyarrow时多线程解析）
+    try_read_csv_pandas 完整读取CSV，固定使用pandas单线程解析（用于对比）
+    extract_full_score  从总分列名提取满分
+    clean_score         清洗总分列
+    assign_scores       得分率映射为统计分
+    assign_rule_sets    得分率一次映射为当前规则和RULE_SETS中各对比规则的统计分及分数段
+    score_stats         累加分数分布（缺考、均值、得分率分位数、各分数段人数）
+    write               保存_统计后文件
+    write_parquet       另存为Parquet（xlsx的总分列混有数字和缺考，检验能否按Arrow列类型写出；需要pyarrow）
+    write_feather       另存为Feather（同上）
+    compact_result      取出汇总用的精简结果
+    summary_memory      汇总（使用内存中的结果）
+    summary_disk        汇总（从处理后文件读取）
+    wide_table          导出成绩册宽表（每名学生一行、每个作业一列）
+    start_statistics    完整批处理（读取+计算+保存）
+
+另外用 python -X importtime 在子进程中测量启动耗时（取多次中最快一次）：
+    import_gui          导入图形界面模块（不应导入pandas/numpy等重量级模块，否则记为变慢）
+    import_engine       导入统计引擎score_engine
+
+示例：
+    python benchmarks/run_benchmarks.py
+    python benchmarks/run_benchmarks.py --sizes 1000,1000000 --formats csv-gbk --output 新版本.json
+    python benchmarks/run_benchmarks.py --compare 旧版本.json
+"""
+import argparse
+import importlib.util
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCHMARK_DIR)
+sys.path.insert(0, REPO_DIR)
+
+from gen_gradebook import FORMATS, generate_files  # noqa: E402
+from score_engine import (  # noqa: E402
+    EXCEL_READ_ENGINE, EXCEL_WRITE_ENGINE, ScoreEngine, ScoreStats, match_columns, processed_path_for, write_table,
+)
+
+SEGMENTS = [(0, 0.59, 0), (0.6, 0.69, 1), (0.7, 0.79, 2), (0.8, 0.89, 3), (0.9, 1.0, 4)]
+RULE_SETS = {"两档": [(0, 0.59, 1), (0.6, 1.0, 2)], "宽松": [(0, 0.49, 0), (0.5, 0.74, 2), (0.75, 1.0, 4)]}
+STARTUP_MODULES = {"import_gui": "通用成绩统计工具", "import_engine": "score_engine"}
+HEAVY_MODULES = ("pandas", "numpy", "chardet")  # 图形界面启动时不应导入的模块
+ARROW_FORMATS = ("parquet", "feather") if importlib.util.find_spec("pyarrow") else ()
+
+
+def git_commit():
+    """当前代码的git提交号，不在git仓库中时为空"""
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BENCHMARK_DIR, capture_output=True,
+                              text=True, timeout=10).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return ""
+
+
+def time_stages(paths, folder):
+    """对一组成绩文件逐环节计时，返回{环节: 秒}"""
+    timings = {}
+
+    def timed(stage, func, *args):
+        start = time.perf_counter()
+        value = func(*args)
+        timings[stage] = timings.get(stage, 0.0) + time.perf_counter() - start
+        return value
+
+    engine = ScoreEngine(score_segments=SEGMENTS, log=lambda msg: None)
+    rule_engine = ScoreEngine(score_segments=SEGMENTS, rule_sets=RULE_SETS, log=lambda msg: None)
+    pandas_engine = ScoreEngine(csv_engine="pandas", log=lambda msg: None)
+    processed_paths = []
+    for path in paths:
+        columns, _ = timed("read_columns", engine.read_columns, path)
+        engine.name_column, engine.id_column, engine.score_column = match_columns(columns)
+        df, _ = timed("try_read_csv" if path.endswith('.csv') else "read_excel_sheet", engine.read_file, path)
+        if path.endswith('.csv'):
+            timed("try_read_csv_pandas", pandas_engine.read_file, path)
+        full_score = timed("extract_full_score", engine.extract_full_score, engine.score_column,
+                           os.path.basename(path), path, False)
+        df['实际得分'] = timed("clean_score", engine.clean_score_column, df[engine.score_column])
+        df['得分率'] = df['实际得分'] / full_score
+        df['统计分'] = timed("assign_scores", engine.assign_scores, df['得分率'].to_numpy())
+        timed("assign_rule_sets", rule_engine.rule_table.lookup, df['得分率'].to_numpy())
+        rates = df['得分率'].to_numpy()
+        segment_ids = engine.segment_table.segment_of[engine.segment_table.codes(rates)]
+        timed("score_stats", lambda: ScoreStats(len(SEGMENTS), full_score).update(
+            df['实际得分'].to_numpy(), rates, engine.absent_mask(df[engine.score_column], df['实际得分'].to_numpy()),
+            segment_ids))
+        processed_path = processed_path_for(path)
+        timed("write", write_table, df, processed_path)
+        for output_format in ARROW_FORMATS:
+            timed(f"write_{output_format}", write_table, df, processed_path_for(path, output_format))
+        engine.results[processed_path] = timed("compact_result", engine.compact_result, df)
+        processed_paths.append(processed_path)
+
+    timed("summary_memory", engine.summary_total_score, processed_paths, folder)
+    timed("wide_table", engine.export_wide_table, processed_paths, folder)
+    engine.results.clear()
+    timed("summary_disk", engine.summary_total_score, processed_paths, folder)
+
+    engine = ScoreEngine(*match_columns(engine.read_columns(paths[0])[0]), score_segments=SEGMENTS,
+                         log=lambda msg: None)
+    timed("start_statistics", engine.start_statistics, paths)
+    if engine.errors:
+        raise RuntimeError(f"批处理失败：{engine.errors}")
+    return timings
+
+
+def run_case(file_format, rows, files, problems, repeat):
+    """生成一种格式/规模的成绩单并计时，每个环节取repeat次中最快的一次"""
+    with tempfile.TemporaryDirectory() as folder:
+        paths = generate_files(folder, rows, files, file_format, problems)
+        best = {}
+        for _ in range(repeat):
+            for stage, seconds in time_stages(paths, folder).items():
+                best[stage] = min(seconds, best.get(stage, seconds))
+    total_rows = rows * files
+    return {
+        "format": file_format,
+        "rows": rows,
+        "files": files,
+        "stages": {stage: {"seconds": round(seconds, 6), "rows_per_sec": round(total_rows / seconds) if seconds else None}
+                   for stage, seconds in best.items()},
+    }
+
+
+def import_time(module):
+    """
+    在新的Python进程中用 -X importtime 导入module
+    :return: (累计导入耗时秒, 导入过的全部模块名)，导入失败（如没有tkinter）时为(None, 空集合)
+    """
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], cwd=REPO_DIR,
+                          capture_output=True, text=True, encoding="utf-8", timeout=120)
+    if proc.returncode != 0:
+        return None, set()
+    seconds, modules = None, set()
+    for line in proc.stderr.splitlines():
+        # 格式：import time: 自身微秒 | 累计微秒 | 模块名（按层级缩进）
+        if not line.startswith("import time:") or line.endswith("imported package"):
+            continue
+        _, cumulative, name = line.split("|")
+        name = name.strip()
+        modules.add(name)
+        if name == module:
+            seconds = int(cumulative) / 1e6
+    return seconds, modules
+
+
+def run_startup(repeat):
+    """启动耗时：图形界面模块和统计引擎各导入repeat次取最快，并记录图形界面启动时导入的重量级模块"""
+    stages, heavy = {}, []
+    for stage, module in STARTUP_MODULES.items():
+        best = None
+        for _ in range(repeat):
+            seconds, modules = import_time(module)
+            if seconds is None:
+                print(f"\n跳过 {stage}：无法导入 {module}")
+                break
+            best = seconds if best is None else min(best, seconds)
+            if stage == "import_gui":
+                heavy = sorted(name for name in modules if name in HEAVY_MODULES)
+        if best is not None:
+            stages[stage] = {"seconds": round(best, 6), "rows_per_sec": None}
+    return {"format": "startup", "rows": 0, "files": 0, "stages": stages, "heavy_modules": heavy}
+
+
+def print_startup(case):
+    print("\n启动耗时（python -X importtime）")
+    for stage, result in case["stages"].items():
+        print(f"  {stage:<20}{result['seconds']:>10.3f}秒")
+    if case["heavy_modules"]:
+        print(f"  警告：图形界面启动时导入了 {', '.join(case['heavy_modules'])}，窗口会延迟显示")
+
+
+def print_case(case):
+    print(f"\n{case['format']}  {case['rows']}行 x {case['files']}个文件")
+    for stage, result in case["stages"].items():
+        print(f"  {stage:<20}{result['seconds']:>10.3f}秒{result['rows_per_sec'] or 0:>14,}行/秒")
+
+
+def compare(results, baseline_path, threshold):
+    """与旧的结果逐环节比较，返回变慢超过threshold倍的环节数"""
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = json.load(f)
+    old_cases = {(case["format"], case["rows"]): case for case in baseline["cases"]}
+    print(f"\n与 {baseline_path}（{baseline['meta'].get('commit') or '未知版本'}）比较：")
+    regressions = 0
+    for case in results["cases"]:
+        old_case = old_cases.get((case["format"], case["rows"]))
+        if old_case is None:
+            continue
+        for stage, result in case["stages"].items():
+            old = old_case["stages"].get(stage)
+            if not old or not old["seconds"] or not result["seconds"]:
+                continue
+            ratio = result["seconds"] / old["seconds"]
+            flag = ""
+            if ratio > threshold:
+                flag = "  <-- 变慢"
+                regressions += 1
+            print(f"  {case['format']:<14}{case['rows']:>9}行  {stage:<20}{old['seconds']:>9.3f} -> "
+                  f"{result['seconds']:>9.3f}秒  x{ratio:.2f}{flag}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="PTA成绩统计性能基准测试")
+    parser.add_argument("--sizes", default="1000,10000,100000", help="每份成绩单的学生数，逗号分隔（默认1000,10000,100000）")
+    parser.add_argument("--formats", default=",".join(FORMATS), help=f"文件格式，逗号分隔（默认{','.join(FORMATS)}）")
+    parser.add_argument("--files", type=int, default=3, help="每种规模的成绩单份数，汇总环节合并这些文件（默认3）")
+    parser.add_argument("--problems", type=int, default=20, help="题目列数（默认20）")
+    parser.add_argument("--xlsx-max-rows", type=int, default=100000, help="xlsx只测试不超过此行数的规模（默认100000）")
+    parser.add_argument("--repeat", type=int, default=1, help="每种规模重复次数，取最快一次（默认1）")
+    parser.add_argument("--startup-repeat", type=int, default=5,
+                        help="启动耗时测量次数，取最快一次（默认5，0为不测量）")
+    parser.add_argument("--output", default="benchmark_results.json", help="结果JSON文件（默认benchmark_results.json）")
+    parser.add_argument("--compare", default=None, help="与之前保存的结果JSON比较")
+    parser.add_argument("--threshold", type=float, default=1.2, help="比较时耗时超过旧结果此倍数记为变慢（默认1.2）")
+    args = parser.parse_args(argv)
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    formats = args.formats.split(",")
+    for file_format in formats:
+        if file_format not in FORMATS:
+            parser.error(f"不支持的格式：{file_format}（可选：{','.join(FORMATS)}）")
+
+    results = {
+        "meta": {
+            "time": datetime.now().isoformat(timespec="seconds"),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "excel_engines": {"read": EXCEL_READ_ENGINE, "write": EXCEL_WRITE_ENGINE},
+            "problems": args.problems,
+        },
+        "cases": [],
+    }
+    regressions = 0
+    if args.startup_repeat > 0:
+        startup = run_startup(args.startup_repeat)
+        print_startup(startup)
+        results["cases"].append(startup)
+        regressions += bool(startup["heavy_modules"])
+    for file_format in formats:
+        for rows in sizes:
+            if file_format == "xlsx" and rows > args.xlsx_max_rows:
+                print(f"\n跳过 xlsx {rows}行（超过 --xlsx-max-rows {args.xlsx_max_rows}）")
+                continue
+            case = run_case(file_format, rows, args.files, args.problems, args.repeat)
+            print_case(case)
+            results["cases"].append(case)
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=1)
+    print(f"\n结果已保存至：{args.output}")
+
+    if args.compare:
+        regressions += compare(results, args.compare, args.threshold)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,197 @@
+"""
+PTA成绩统计命令行入口（无需图形界面，可在服务器/定时任务中批量运行）
+
+示例：
+    python score_cli.py 成绩文件夹 --segments "0,0.59,1;0.6,1.0,2"
+    python score_cli.py 成绩文件夹 --segments "0,0.59,1;0.6,1.0,2" --watch
+    python score_cli.py 成绩文件夹 --segments "0,0.59,1;0.6,1.0,2" --rule-set "宽松=0,0.49,1;0.5,1.0,2"
+    python score_cli.py a.csv b.xlsx --segments "0,0.59,1;0.6,1.0,2" --full-score 100 --skip-rows 0
+"""
+import argparse
+import os
+import sys
+import zipfile
+from datetime import datetime
+
+from score_engine import (
+    CSV_ENGINES, OUTPUT_FORMATS, WIDE_TABLE_FORMATS, WIDE_TABLE_VALUES, FolderWatcher, ScoreEngine, list_score_files,
+    match_columns, open_log_file, parse_rule_sets, parse_segment_text,
+)
+
+
+def parse_full_score_items(items):
+    """解析 --full-score-for 文件名=满分"""
+    full_scores = {}
+    for item in items:
+        name, sep, value = item.rpartition('=')
+        if not sep or not name:
+            raise ValueError(f"--full-score-for 格式应为「文件名=满分」：{item}")
+        full_scores[name] = float(value)
+    return full_scores
+
+
+def parse_wide_values(text):
+    """解析 --wide-values 统计分,实际得分,得分率"""
+    values = [item.strip() for item in text.replace('，', ',').split(',') if item.strip()]
+    for value in values:
+        if value not in WIDE_TABLE_VALUES:
+            raise ValueError(f"--wide-values 只能为{'、'.join(WIDE_TABLE_VALUES)}：{value}")
+    return values
+
+
+def collect_files(paths):
+    """展开命令行中的文件/文件夹路径，保持顺序并去重"""
+    file_paths = []
+    for path in paths:
+        if os.path.isdir(path):
+            file_paths.extend(list_score_files(path))
+        elif os.path.isfile(path):
+            file_paths.append(path)
+        else:
+            raise ValueError(f"文件或文件夹不存在：{path}")
+    return list(dict.fromkeys(file_paths))
+
+
+def make_log(log_file):
+    """日志打印到控制台；指定了日志文件时同时写入（按大小轮转）"""
+    try:
+        file_log = open_log_file(log_file, "score_cli") if log_file else None
+    except OSError as e:
+        raise ValueError(f"无法打开日志文件：{e}")
+
+    def log(msg):
+        print(f"{datetime.now().strftime('[%H:%M:%S]')} {msg}")
+        if file_log is not None:
+            file_log.info(msg)
+    return log
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="通用成绩统计工具（命令行版，适配PTA成绩单）")
+    parser.add_argument("paths", nargs="+", help="成绩文件（CSV/XLSX）或所在文件夹")
+    parser.add_argument("--segments", required=True,
+                        help="得分率-分数段规则，格式：起始得分率,结束得分率,对应分值;...（例：0,0.59,1;0.6,1.0,2）")
+    parser.add_argument("--rule-set", action="append", default=[], metavar="名称=规则",
+                        help="对比规则（格式同--segments，可重复使用）：每套规则另外输出一列统计分_名称，"
+                             "汇总中并列输出各自的总分，并保存各分数段人次的规则对比表；每个文件仍只读取一次")
+    parser.add_argument("--name-column", default="", help="姓名列（默认按列名自动匹配）")
+    parser.add_argument("--id-column", default="", help="学号列（默认按列名自动匹配）")
+    parser.add_argument("--score-column", default="", help="总分列（默认按列名自动匹配）")
+    parser.add_argument("--skip-rows", type=int, default=0, help="表头跳过行数（默认0）")
+    parser.add_argument("--full-score", type=float, default=None, help="列名中提取不到满分时使用的满分")
+    parser.add_argument("--full-score-for", action="append", default=[], metavar="文件名=满分",
+                        help="指定某个文件的满分，可重复使用")
+    parser.add_argument("--workers", type=int, default=1, help="并行处理的进程数（默认1，逐个处理）")
+    parser.add_argument("--chunk-size", type=int, default=0,
+                        help="CSV文件按此行数分块流式处理，内存占用与文件大小无关（默认0，整表读取）")
+    parser.add_argument("--compact-output", action="store_true",
+                        help="精简输出：处理后文件只保留姓名/学号/总分列和计算出的三列，读取时只解析这三列")
+    parser.add_argument("--output-format", choices=sorted(OUTPUT_FORMATS), default="",
+                        help="处理后文件和汇总文件保存为Parquet或Feather（需要pyarrow，默认与原文件格式相同，汇总为CSV）")
+    parser.add_argument("--csv-engine", choices=CSV_ENGINES, default="auto",
+                        help="CSV解析引擎：auto（默认）装有pyarrow时用pyarrow多线程解析，遇到坏行等情况自动改用pandas；"
+                             "pandas为单线程解析")
+    parser.add_argument("--incremental", action="store_true",
+                        help="增量处理：跳过源文件和处理设置都未变化的文件，沿用已有的_统计后文件")
+    parser.add_argument("--db", default="", metavar="成绩库.sqlite3",
+                        help="成绩库（SQLite）路径：每个文件的逐个学生结果写入成绩库，汇总用一条SQL完成")
+    parser.add_argument("--timing-report", action="store_true",
+                        help="在输出目录写出逐文件逐环节的耗时报告（成绩统计耗时报告_统计/_汇总.json和.csv）")
+    parser.add_argument("--profile", action="store_true",
+                        help="用cProfile和tracemalloc分析本次运行，结果保存为成绩统计性能分析_统计/_汇总.prof和.txt")
+    parser.add_argument("--verbose", action="store_true", help="详细日志：同时输出每个文件使用的编码、读取的列等细节")
+    parser.add_argument("--log-file", default="", metavar="日志文件",
+                        help="日志同时写入此文件，超过1MB时轮转为.1/.2/.3")
+    parser.add_argument("--watch", action="store_true",
+                        help="持续监视文件夹（含子文件夹）：新增或修改的成绩文件稳定后自动处理并更新汇总，按Ctrl+C结束")
+    parser.add_argument("--interval", type=float, default=5.0, help="监视模式下两次扫描的间隔秒数（默认5）")
+    parser.add_argument("--settle", type=float, default=2.0,
+                        help="监视模式下文件大小和修改时间保持不变多少秒后才处理（默认2，避免读取写入到一半的文件）")
+    parser.add_argument("--summary-dir", default=None, help="汇总文件保存目录（默认与第一个处理后文件相同）")
+    parser.add_argument("--no-summary", action="store_true", help="只添加统计分，不汇总总分")
+    parser.add_argument("--wide-table", choices=list(WIDE_TABLE_FORMATS), default=None,
+                        help="另外导出成绩册宽表（每名学生一行、每个作业一列，没有参加的作业为空），保存在汇总目录")
+    parser.add_argument("--wide-values", default="统计分",
+                        help=f"成绩册中每个作业输出的值，逗号分隔，可选{','.join(WIDE_TABLE_VALUES)}（默认统计分）")
+    return parser
+
+
+def build_engine(args, log):
+    engine = ScoreEngine(
+        skip_rows=args.skip_rows,
+        full_scores=parse_full_score_items(args.full_score_for),
+        default_full_score=args.full_score,
+        workers=args.workers,
+        incremental=args.incremental,
+        chunk_size=args.chunk_size,
+        compact_output=args.compact_output,
+        output_format=args.output_format,
+        db_path=args.db,
+        timing_report=args.timing_report,
+        profile=args.profile,
+        verbose=args.verbose,
+        csv_engine=args.csv_engine,
+        log=log,
+    )
+    engine.set_segments(parse_segment_text(args.segments))
+    engine.set_rule_sets(parse_rule_sets(args.rule_set))
+    return engine
+
+
+def watch(args, log):
+    """监视模式：引擎和各文件结果一直保留在内存中，只处理新增/修改的文件"""
+    if len(args.paths) != 1 or not os.path.isdir(args.paths[0]):
+        raise ValueError("监视模式需要指定一个文件夹")
+    engine = build_engine(args, log)
+    # 指定的列直接使用，未指定的在第一批文件到达时自动匹配
+    engine.name_column, engine.id_column, engine.score_column = args.name_column, args.id_column, args.score_column
+    watcher = FolderWatcher(engine, args.paths[0], interval=args.interval, settle=args.settle,
+                            summary=not args.no_summary, summary_dir=args.summary_dir)
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        engine.log("已停止监视")
+    return 0
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    try:
+        log = make_log(args.log_file)
+        if args.watch:
+            return watch(args, log)
+        file_paths = collect_files(args.paths)
+        if not file_paths:
+            raise ValueError("没有找到CSV/XLSX成绩文件！")
+        # 处理前先检查成绩册的取值，写错时不必等整批处理完才报错
+        wide_values = parse_wide_values(args.wide_values) if args.wide_table else None
+        engine = build_engine(args, log)
+
+        # 未指定的列按第一个文件的列名自动匹配
+        columns, _ = engine.read_columns(file_paths[0])
+        name_col, id_col, score_col = match_columns(columns)
+        engine.name_column = args.name_column or name_col
+        engine.id_column = args.id_column or id_col
+        engine.score_column = args.score_column or score_col
+        engine.log(f"使用列名：姓名列={engine.name_column}, 学号列={engine.id_column}, 总分列={engine.score_column}")
+        # 并行扫描全部文件的表头，按列名分组报告各文件使用的总分列、满分和存在的问题
+        engine.scan_files(file_paths)
+
+        engine.start_statistics(file_paths)
+        failed = len(engine.errors)
+        if not args.no_summary and engine.processed_paths:
+            engine.summary_total_score(summary_dir=args.summary_dir)
+            failed += len(engine.errors)
+        if args.wide_table and engine.processed_paths:
+            engine.export_wide_table(summary_dir=args.summary_dir, values=wide_values, file_format=args.wide_table)
+            failed += len(engine.errors)
+    except (ValueError, OSError, zipfile.BadZipFile) as e:  # 参数错误，或第一个文件损坏/无法读取
+        print(f"错误：{e}", file=sys.stderr)
+        return 2
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,2422 @@
+"""
+PTA成绩统计核心引擎
+读取成绩单、提取满分、清洗分数、按得分率映射统计分、汇总总分，全部不依赖tkinter，
+图形界面（通用成绩统计工具.py）和命令行（score_cli.py）共用这一套处理逻辑
+"""
+import codecs
+import csv
+import hashlib
+import importlib.util
+import io
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from datetime import datetime
+from types import SimpleNamespace
+import traceback
+
+import numpy as np
+import pandas as pd
+
+PROCESSED_SUFFIX = "_统计后"  # 处理后文件名后缀
+SUMMARY_FILE_NAME = "成绩统计总分汇总.csv"
+SCORE_FILE_TYPES = ('.csv', '.xlsx')
+SKIPPED_SCORE_TEXTS = ['未开考', '缺考']  # 按0分处理的成绩文本
+HEADER_SAMPLE_SIZE = 64 * 1024  # 只读表头时读取的文件开头字节数
+ENCODING_DETECT_SIZE = 64 * 1024  # chardet检测编码使用的字节数
+STREAM_BLOCK_SIZE = 1024 * 1024  # 分块处理时校验编码每次读取的字节数
+MANIFEST_FILE_NAME = "成绩统计增量缓存.json"  # 增量处理清单（与源文件同目录）
+MANIFEST_VERSION = 1
+TIMING_REPORT_NAME = "成绩统计耗时报告"  # 耗时报告文件名前缀（后接_统计/_汇总）
+PROFILE_FILE_NAME = "成绩统计性能分析"  # 性能分析文件名前缀（后接_统计/_汇总）
+WIDE_TABLE_NAME = "成绩统计成绩册"  # 成绩册宽表文件名（每名学生一行、每个作业一列）
+WIDE_TABLE_VALUES = ('统计分', '实际得分', '得分率')  # 成绩册中每个作业可输出的值
+RULE_REPORT_NAME = "成绩统计规则对比"  # 各套规则每个分数段人次的对比表（与汇总文件同目录）
+CURRENT_RULE_NAME = "当前规则"  # 规则对比表中主分数段规则（统计分列使用的规则）的名称
+STATS_REPORT_NAME = "成绩统计分数分布"  # 逐文件和整批的分数分布统计表（与处理后文件同目录）
+STATS_PERCENTILES = {"25分位数": 0.25, "中位数": 0.5, "75分位数": 0.75, "90分位数": 0.9}  # 分布统计表中的分位数
+STATS_SKETCH_SIZE = 4096  # 得分率不同取值超过此数时按1/此数取整合并（分位数误差不超过满分的1/4096）
+GRADEBOOK_FILE_NAME = "成绩库.sqlite3"  # 图形界面启用成绩库时的默认文件名（与成绩文件同目录）
+FILE_INFO_RESULT_KEYS = ("encoding", "full_score", "processed_path", "rows", "rule_counts", "stats")  # 并行处理时子进程返回的文件信息
+SCAN_WORKERS = 8  # 并行扫描表头的线程数（只读文件开头，主要是磁盘等待）
+LOG_FILE_MAX_BYTES = 1024 * 1024  # 日志文件超过此大小时轮转
+LOG_FILE_BACKUPS = 3  # 轮转后保留的旧日志文件数（.1 ~ .3）
+OUTPUT_FORMATS = {"parquet": ".parquet", "feather": ".feather"}  # 可选的列式输出格式（需要pyarrow）
+WIDE_TABLE_FORMATS = {"csv": ".csv", "xlsx": ".xlsx", **OUTPUT_FORMATS}  # 成绩册可选的保存格式
+# CSV解析引擎：auto在装有pyarrow时用pyarrow多线程解析、遇到它处理不了的文件自动改用pandas，pandas为原有的单线程解析
+CSV_ENGINES = ("auto", "pyarrow", "pandas")
+# pandas read_csv默认识别为空值的文本，pyarrow解析时使用同一组，保证两种引擎的结果一致
+CSV_NA_VALUES = ['', '#N/A', '#N/A N/A', '#NA', '-1.#IND', '-1.#QNAN', '-NaN', '-nan', '1.#IND', '1.#QNAN', '<NA>',
+                 'N/A', 'NA', 'NULL', 'NaN', 'None', 'n/a', 'nan', 'null']
+# xlsx读写引擎：装了python-calamine/xlsxwriter时用更快的引擎，否则用openpyxl
+EXCEL_READ_ENGINE = "calamine" if importlib.util.find_spec("python_calamine") else "openpyxl"
+EXCEL_WRITE_ENGINE = "xlsxwriter" if importlib.util.find_spec("xlsxwriter") else "openpyxl"
+
+
+class SegmentTable:
+    """
+    得分率-分数段规则编译后的查找表
+    规则只在编译时展开一次：所有边界点排序后，把[0,1]切成「边界点」和「相邻边界点之间的开区间」两类片段，
+    每个片段按规则顺序取第一个命中的分值（闭区间、先匹配先得，与逐行匹配结果一致），
+    映射时对整列得分率做两次searchsorted即可定位片段，不再逐行遍历规则
+    """
+
+    def __init__(self, segments, points=()):
+        """:param points: 额外的边界点（与其他规则共用同一套片段时传入），不影响映射结果"""
+        self.segments = list(segments)
+        bounds = {0.0, 1.0} | {b for seg in self.segments for b in seg[:2]} | set(points)
+        self.points = np.array(sorted(bounds), dtype=float)
+
+        # 片段编码：奇数2j+1为边界点points[j]本身，偶数2j为points[j-1]与points[j]之间的开区间
+        # 编码0和编码2m（小于/大于所有边界点）在[0,1]之外，截断后只有得分率为NaN时落在2m
+        # segment_of为每个片段命中的分数段序号，未覆盖记为len(segments)，NaN记为len(segments)+1
+        piece_count = 2 * len(self.points) + 1
+        self.scores = np.zeros(piece_count, dtype=float)
+        self.segment_of = np.full(piece_count, len(self.segments) + 1, dtype=np.intp)
+        matched = np.zeros(piece_count, dtype=bool)
+        for code in range(1, piece_count - 1):
+            lo, hi = self._piece_bounds(code)
+            self.segment_of[code] = len(self.segments)
+            for index, (min_rate, max_rate, assign_score) in enumerate(self.segments):
+                if min_rate <= lo and hi <= max_rate:
+                    self.scores[code] = assign_score
+                    self.segment_of[code] = index
+                    matched[code] = True
+                    break
+
+        self.gaps = self._describe_gaps(matched)
+        self.overlaps = [
+            (i + 1, j + 1)
+            for i, (min_i, max_i, _) in enumerate(self.segments)
+            for j, (min_j, max_j, _) in enumerate(self.segments)
+            if i < j and max(min_i, min_j) <= min(max_i, max_j)
+        ]
+
+    def _piece_bounds(self, code):
+        j = code // 2
+        if code % 2:
+            return self.points[j], self.points[j]
+        return self.points[j - 1], self.points[j]
+
+    def _describe_gaps(self, matched):
+        """把连续未命中的片段合并成区间描述，如「(0.59, 0.6)」"""
+        gaps = []
+        code = 1
+        while code < len(matched) - 1:
+            if matched[code]:
+                code += 1
+                continue
+            start = code
+            while code < len(matched) - 1 and not matched[code]:
+                code += 1
+            end = code - 1
+            left = f"[{self.points[start // 2]:g}" if start % 2 else f"({self.points[start // 2 - 1]:g}"
+            right = f"{self.points[end // 2]:g}]" if end % 2 else f"{self.points[end // 2]:g})"
+            gaps.append(f"{left}, {right}")
+        return gaps
+
+    def codes(self, rates):
+        """整列得分率（先截断到[0,1]）所在的片段编码"""
+        rates = np.clip(np.asarray(rates, dtype=float), 0.0, 1.0)
+        return np.searchsorted(self.points, rates, side="left") + np.searchsorted(self.points, rates, side="right")
+
+    def lookup(self, rates):
+        """整列得分率映射为统计分"""
+        return self.scores[self.codes(rates)]
+
+
+class RuleSetTable:
+    """
+    多套得分率-分数段规则合并编译：所有规则的边界点合在一起切分片段，每套规则在同一套片段上编译一张SegmentTable，
+    再把各表的分值和分数段序号按列拼成「片段×规则」的二维查找表；
+    映射时整列得分率只定位一次片段，一次取出每行在各套规则下的统计分和分数段，与逐套规则分别映射的结果一致
+    """
+
+    def __init__(self, segment_lists):
+        points = {b for segments in segment_lists for seg in segments for b in seg[:2]}
+        self.tables = [SegmentTable(segments, points) for segments in segment_lists]
+        self.scores = np.column_stack([table.scores for table in self.tables])
+        # 分数段序号在各套规则之间连续编号（每套规则末尾另有「未覆盖」「无得分率」两个编号），便于一次bincount计数
+        sizes = [len(table.segments) + 2 for table in self.tables]
+        self.offsets = np.concatenate([[0], np.cumsum(sizes)])
+        self.segment_ids = np.column_stack([table.segment_of + offset
+                                            for table, offset in zip(self.tables, self.offsets)])
+
+    def lookup(self, rates):
+        """:return: (统计分, 分数段编号)，均为 行数×规则数 的数组"""
+        codes = self.tables[0].codes(rates)
+        return self.scores[codes], self.segment_ids[codes]
+
+    def count(self, segment_ids):
+        """各套规则每个分数段的人次，按编号排成一维数组"""
+        return np.bincount(np.ravel(segment_ids), minlength=self.offsets[-1])
+
+    def split_counts(self, counts):
+        """把count()的结果拆成每套规则一段"""
+        return [counts[start:end] for start, end in zip(self.offsets[:-1], self.offsets[1:])]
+
+
+def parse_segment_text(text):
+    """
+    解析文本形式的分数段规则，格式与界面提示一致：「0,0.59,1;0.6,1.0,2」（也接受中文分号/逗号）
+    :return: [(min_rate, max_rate, score), ...]，规则不合法时抛出ValueError
+    """
+    segments = []
+    parts = [p for p in re.split(r'[;；\n]', text) if p.strip()]
+    for i, part in enumerate(parts):
+        values = [v.strip() for v in re.split(r'[,，]', part)]
+        if len(values) != 3:
+            raise ValueError(f"第{i + 1}个分数段：需填写「起始得分率,结束得分率,对应分值」三个数！")
+        try:
+            min_rate, max_rate, assign_score = (float(v) for v in values)
+        except ValueError:
+            raise ValueError(f"第{i + 1}个分数段：请输入有效的数字！")
+        if not (0 <= min_rate <= 1) or not (0 <= max_rate <= 1):
+            raise ValueError(f"第{i + 1}个分数段：得分率需在0-1之间！")
+        if min_rate > max_rate:
+            raise ValueError(f"第{i + 1}个分数段：起始得分率不能大于结束得分率！")
+        segments.append((min_rate, max_rate, assign_score))
+    if not segments:
+        raise ValueError("未填写任何分数段规则！")
+    return segments
+
+
+def parse_rule_sets(items):
+    """
+    解析对比规则，每项格式为「名称=分数段规则」，如「宽松=0,0.49,1;0.5,1.0,2」
+    :return: {名称: [(min_rate, max_rate, score), ...]}，按输入顺序；格式不合法或名称重复时抛出ValueError
+    """
+    rule_sets = {}
+    for item in items:
+        name, sep, text = item.partition('=')
+        name = name.strip()
+        if not sep or not name:
+            raise ValueError(f"对比规则格式应为「名称=起始得分率,结束得分率,对应分值;...」：{item}")
+        if name in rule_sets or name == CURRENT_RULE_NAME:
+            raise ValueError(f"对比规则名称重复：{name}")
+        try:
+            rule_sets[name] = parse_segment_text(text)
+        except ValueError as e:
+            raise ValueError(f"对比规则「{name}」{e}")
+    return rule_sets
+
+
+def match_columns(columns):
+    """
+    按PTA成绩单的列名规律自动匹配姓名列、学号列、总分列
+    :return: (姓名列, 学号列, 总分列)，匹配不到的为空字符串
+    """
+    name_col = id_col = score_col = ""
+    for col in columns:
+        col_str = str(col).strip()
+        if not name_col and (col_str == "Unnamed: 1" or "姓名" in col_str):
+            name_col = col_str
+        if not id_col and (col_str == "Unnamed: 2" or "学号" in col_str):
+            id_col = col_str
+        if not score_col and (col_str == "Unnamed: 4" or "总分" in col_str):
+            score_col = col_str
+    return name_col, id_col, score_col
+
+
+def is_score_file(name):
+    """是否为待统计的CSV/XLSX文件（跳过已生成的_统计后文件、汇总文件、成绩册、各种统计报告和~$临时文件）"""
+    return (name.lower().endswith(SCORE_FILE_TYPES) and PROCESSED_SUFFIX not in name and name != SUMMARY_FILE_NAME
+            and not name.startswith((TIMING_REPORT_NAME, WIDE_TABLE_NAME, RULE_REPORT_NAME, STATS_REPORT_NAME, "~$")))
+
+
+def list_score_files(folder):
+    """列出文件夹下待统计的CSV/XLSX文件（跳过已生成的_统计后文件和汇总文件）"""
+    return sorted(os.path.join(folder, f) for f in os.listdir(folder) if is_score_file(f))
+
+
+def scan_score_files(folder):
+    """
+    用os.scandir递归列出文件夹及其子文件夹（跳过.开头的隐藏文件夹）中待统计的成绩文件
+    :return: {文件路径: (大小, 修改时间纳秒)}，扫描期间被删除或无权访问的文件/文件夹直接跳过
+    """
+    found = {}
+    folders = [folder]
+    while folders:
+        try:
+            with os.scandir(folders.pop()) as entries:
+                entries = list(entries)
+        except OSError:
+            continue
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if not entry.name.startswith('.'):
+                        folders.append(entry.path)
+                elif entry.is_file() and is_score_file(entry.name):
+                    stat = entry.stat()
+                    found[entry.path] = (stat.st_size, stat.st_mtime_ns)
+            except OSError:
+                continue
+    return found
+
+
+def processed_path_for(file_path, output_format=""):
+    """原文件对应的处理后文件路径（带_统计后后缀），output_format为空时与原文件格式相同"""
+    base, ext = os.path.splitext(file_path)
+    return f"{base}{PROCESSED_SUFFIX}{OUTPUT_FORMATS.get(output_format, ext)}"
+
+
+def summary_path_for(summary_dir, output_format=""):
+    """汇总文件路径，output_format为空时保存为CSV"""
+    base, ext = os.path.splitext(SUMMARY_FILE_NAME)
+    return os.path.join(summary_dir, base + OUTPUT_FORMATS.get(output_format, ext))
+
+
+def wide_table_path_for(summary_dir, file_format):
+    """成绩册文件路径，file_format为WIDE_TABLE_FORMATS中的一种"""
+    return os.path.join(summary_dir, WIDE_TABLE_NAME + WIDE_TABLE_FORMATS[file_format])
+
+
+def check_output_format(output_format):
+    """检查输出格式是否可用：Parquet/Feather需要安装pyarrow"""
+    if not output_format:
+        return
+    if output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"不支持的输出格式：{output_format}（可选：{'、'.join(OUTPUT_FORMATS)}）")
+    if not importlib.util.find_spec("pyarrow"):
+        raise ValueError(f"输出{output_format}格式需要安装pyarrow：pip install pyarrow")
+
+
+def check_csv_engine(csv_engine):
+    """检查CSV解析引擎是否可用：指定pyarrow时需要安装pyarrow（auto在没有pyarrow时直接用pandas）"""
+    if csv_engine not in CSV_ENGINES:
+        raise ValueError(f"不支持的CSV解析引擎：{csv_engine}（可选：{'、'.join(CSV_ENGINES)}）")
+    if csv_engine == "pyarrow" and not importlib.util.find_spec("pyarrow"):
+        raise ValueError("pyarrow解析CSV需要安装pyarrow：pip install pyarrow")
+
+
+def read_columnar(file_path, usecols=None):
+    """
+    读取Parquet/Feather文件，列类型随文件保存，不需要判断编码
+    :param usecols: 只读取的列，可为列名列表或按列名判断的函数；只有选中的列会从文件中读出
+    """
+    if file_path.endswith('.parquet'):
+        import pyarrow.parquet as pq
+        names, reader = pq.read_schema(file_path).names, pd.read_parquet
+    else:
+        import pyarrow as pa
+        with pa.memory_map(file_path) as source:
+            names = pa.ipc.open_file(source).schema.names
+        reader = pd.read_feather
+    if callable(usecols):
+        usecols = [name for name in names if usecols(name)]
+    return reader(file_path, columns=usecols)
+
+
+def arrow_compatible(df):
+    """
+    把混有数字和文本的对象列（如xlsx中混着“缺考”“未开考”的总分列）转为文本列，
+    否则pyarrow按第一个值推断列类型，写Parquet/Feather时会转换失败；空值保持为空
+    """
+    columns = [column for column in df.columns if df[column].dtype == object]
+    if not columns:
+        return df
+    df = df.copy()
+    for column in columns:
+        values = df[column]
+        df[column] = values.where(values.isna(), values.astype(str))
+    return df
+
+
+def temp_path_for(file_path):
+    """写出时使用的临时文件：同目录、~$开头（不会被当作成绩文件扫描），保留扩展名"""
+    folder, name = os.path.split(file_path)
+    return os.path.join(folder, "~$" + name)
+
+
+def write_table(df, file_path):
+    """
+    按扩展名保存表格：CSV用utf-8-sig（避免中文乱码），xlsx/Parquet/Feather保留列类型；
+    先写到临时文件再替换目标文件，写出失败时不留下不完整的文件
+    """
+    tmp_path = temp_path_for(file_path)
+    try:
+        if file_path.endswith('.csv'):
+            df.to_csv(tmp_path, index=False, encoding='utf-8-sig')
+        elif file_path.endswith('.xlsx'):
+            write_excel_sheet(df, tmp_path)
+        elif file_path.endswith('.parquet'):
+            arrow_compatible(df).to_parquet(tmp_path, index=False)
+        else:
+            arrow_compatible(df).reset_index(drop=True).to_feather(tmp_path)
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class ChunkedTableWriter:
+    """
+    分块追加写出处理结果：CSV逐块追加文本（只在第一块写表头），
+    Parquet/Feather按第一块的列类型逐块写入同一个文件；
+    全部写完才把临时文件替换为目标文件，中途出错时删除临时文件
+    """
+
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.tmp_path = temp_path_for(file_path)
+        self.chunk_count = 0
+        self.target = None  # CSV文本文件
+        self.writer = None  # pyarrow的Parquet/Feather写入器
+        self.schema = None
+
+    def __enter__(self):
+        if self.file_path.endswith('.csv'):
+            self.target = open(self.tmp_path, 'w', encoding='utf-8-sig', newline='')
+        return self
+
+    def write(self, df):
+        if self.target is not None:
+            df.to_csv(self.target, index=False, header=self.chunk_count == 0)
+        else:
+            import pyarrow as pa
+            table = pa.Table.from_pandas(arrow_compatible(df), schema=self.schema, preserve_index=False)
+            if self.writer is None:
+                self.schema = table.schema
+                if self.file_path.endswith('.parquet'):
+                    import pyarrow.parquet as pq
+                    self.writer = pq.ParquetWriter(self.tmp_path, self.schema)
+                else:
+                    self.writer = pa.ipc.new_file(self.tmp_path, self.schema)
+            self.writer.write_table(table)
+        self.chunk_count += 1
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if self.target is not None:
+            self.target.close()
+        if self.writer is not None:
+            self.writer.close()
+        if exc_type is None and os.path.exists(self.tmp_path):
+            os.replace(self.tmp_path, self.file_path)
+        elif os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+        return False
+
+
+def excel_header_names(values):
+    """按pandas的规则整理表头单元格：空单元格为Unnamed: n，整数值浮点转int，重名列加.1/.2后缀"""
+    values = list(values)
+    while values and values[-1] in (None, ''):
+        values.pop()
+    names = []
+    for i, value in enumerate(values):
+        if value in (None, ''):
+            value = f"Unnamed: {i}"
+        elif isinstance(value, float) and value.is_integer():
+            value = int(value)
+        names.append(value)
+    counts = {}
+    for i, name in enumerate(names):
+        original, count = name, counts.get(name, 0)
+        while count > 0:
+            counts[original] = count + 1
+            name = f"{original}.{count}"
+            count = count + 1 if name in names else counts.get(name, 0)
+        names[i] = name
+        counts[name] = count + 1
+    return names
+
+
+def read_excel_columns(file_path, skip_rows=0):
+    """只读xlsx第一个工作表的表头行：openpyxl只读模式逐行读取，读到表头即停止，不加载整个工作表"""
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        sheet = workbook.worksheets[0]
+        for row in sheet.iter_rows(min_row=skip_rows + 1, max_row=skip_rows + 1, values_only=True):
+            return excel_header_names(row)
+        return []
+    finally:
+        workbook.close()
+
+
+def read_excel_sheet(file_path, skip_rows=0, usecols=None):
+    """完整读取xlsx：优先用calamine引擎，读取失败时退回openpyxl（只读模式）"""
+    if EXCEL_READ_ENGINE != "openpyxl":
+        try:
+            return pd.read_excel(file_path, skiprows=skip_rows, usecols=usecols, engine=EXCEL_READ_ENGINE)
+        except (OSError, ValueError, KeyError):
+            pass
+    return pd.read_excel(file_path, skiprows=skip_rows, usecols=usecols, engine="openpyxl")
+
+
+def write_excel_sheet(df, file_path):
+    """保存xlsx：有xlsxwriter时用它写，否则用openpyxl的只写模式逐行写出，不在内存中保留单元格对象"""
+    if EXCEL_WRITE_ENGINE == "xlsxwriter":
+        df.to_excel(file_path, index=False, engine="xlsxwriter")
+        return
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet("Sheet1")
+    sheet.append(list(df.columns))
+    values = df.astype(object).where(df.notna(), None)
+    for row in values.itertuples(index=False, name=None):
+        sheet.append(row)
+    workbook.save(file_path)
+
+
+def file_signature(file_path):
+    """文件大小和修改时间，用于快速判断文件是否变化"""
+    stat = os.stat(file_path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def file_sha1(file_path):
+    digest = hashlib.sha1()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ProcessingManifest:
+    """
+    增量处理清单：每个源文件目录下一个JSON文件，按文件名记录源文件指纹、处理设置和_统计后文件指纹
+    """
+
+    def __init__(self):
+        self.folders = {}  # {目录: {文件名: 记录}}
+        self.changed = set()
+
+    def _entries(self, file_path):
+        folder = os.path.dirname(os.path.abspath(file_path))
+        if folder not in self.folders:
+            entries = {}
+            manifest_path = os.path.join(folder, MANIFEST_FILE_NAME)
+            if os.path.exists(manifest_path):
+                try:
+                    with open(manifest_path, encoding='utf-8') as f:
+                        data = json.load(f)
+                    if data.get("version") == MANIFEST_VERSION:
+                        entries = data["files"]
+                except (OSError, ValueError, KeyError):
+                    entries = {}  # 清单损坏时当作没有缓存，全部重新处理
+            self.folders[folder] = entries
+        return folder, self.folders[folder]
+
+    def get(self, file_path):
+        _, entries = self._entries(file_path)
+        return entries.get(os.path.basename(file_path))
+
+    def put(self, file_path, entry):
+        folder, entries = self._entries(file_path)
+        entries[os.path.basename(file_path)] = entry
+        self.changed.add(folder)
+
+    def save(self):
+        for folder in self.changed:
+            manifest_path = os.path.join(folder, MANIFEST_FILE_NAME)
+            tmp_path = manifest_path + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({"version": MANIFEST_VERSION, "files": self.folders[folder]}, f, ensure_ascii=False,
+                          indent=1)
+            os.replace(tmp_path, manifest_path)
+        self.changed.clear()
+
+
+def assignment_name(file_path):
+    """作业名：原文件或处理后文件的文件名去掉扩展名和_统计后后缀"""
+    return os.path.splitext(os.path.basename(file_path))[0].replace(PROCESSED_SUFFIX, '')
+
+
+class GradebookStore:
+    """
+    成绩库：SQLite中按学生逐行保存每个处理后文件的结果（作业、学号、姓名、实际得分、得分率、统计分、满分），
+    学号、作业、文件上建索引，查询某个学生的历次成绩不需要重新解析文件；同一文件的记录在一个事务中整体替换，
+    并记下写入时处理后文件的大小和修改时间，文件在库外被重新生成后据此判断库中的记录已过期
+    """
+
+    def __init__(self, db_path):
+        self.conn = sqlite3.connect(db_path, timeout=60)
+        self.conn.execute("PRAGMA journal_mode=WAL")  # 并行处理时多个进程写入同一个库
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS 成绩 (
+                作业 TEXT NOT NULL,
+                文件 TEXT NOT NULL,
+                行号 INTEGER NOT NULL,
+                学号 TEXT NOT NULL,
+                姓名 TEXT NOT NULL,
+                实际得分 REAL,
+                得分率 REAL,
+                统计分 REAL NOT NULL,
+                满分 REAL
+            );
+            CREATE INDEX IF NOT EXISTS 成绩_学号 ON 成绩 (学号);
+            CREATE INDEX IF NOT EXISTS 成绩_作业 ON 成绩 (作业);
+            CREATE INDEX IF NOT EXISTS 成绩_文件 ON 成绩 (文件, 行号);
+            CREATE TABLE IF NOT EXISTS 文件签名 (
+                文件 TEXT PRIMARY KEY,
+                大小 INTEGER NOT NULL,
+                修改时间 INTEGER NOT NULL
+            );
+        """)
+
+    def close(self):
+        self.conn.close()
+
+    @contextmanager
+    def replace_file(self, processed_path, full_score=None):
+        """
+        在一个事务中替换某个处理后文件的全部记录：先删除旧记录，返回的add(rows)可多次调用逐块批量插入，
+        正常结束时记下处理后文件当前的签名并提交，出错时回滚（库中保留上次的结果）；
+        因此应在处理后文件保存完成之后再结束
+        :param rows: DataFrame(学号, 姓名, 实际得分, 得分率, 统计分)
+        """
+        assignment = assignment_name(processed_path)
+        row_count = 0
+
+        def add(rows):
+            nonlocal row_count
+            count = len(rows)
+            self.conn.executemany(
+                "INSERT INTO 成绩 VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                zip([assignment] * count, [processed_path] * count, range(row_count, row_count + count),
+                    rows["学号"].tolist(), rows["姓名"].tolist(), rows["实际得分"].tolist(),
+                    rows["得分率"].tolist(), rows["统计分"].tolist(), [full_score] * count))
+            row_count += count
+
+        with self.conn:
+            self.conn.execute("DELETE FROM 成绩 WHERE 文件 = ?", (processed_path,))
+            self.conn.execute("DELETE FROM 文件签名 WHERE 文件 = ?", (processed_path,))
+            yield add
+            if os.path.exists(processed_path):
+                signature = file_signature(processed_path)
+                self.conn.execute("INSERT INTO 文件签名 VALUES (?, ?, ?)",
+                                  (processed_path, signature["size"], signature["mtime_ns"]))
+
+    def file_rows(self, processed_path):
+        """库中某个处理后文件的记录数，0表示还没有写入"""
+        return self.conn.execute("SELECT COUNT(*) FROM 成绩 WHERE 文件 = ?", (processed_path,)).fetchone()[0]
+
+    def is_current(self, processed_path):
+        """库中的记录是否对应磁盘上现在的处理后文件（写入时记下的大小、修改时间与现在一致）"""
+        stored = self.conn.execute("SELECT 大小, 修改时间 FROM 文件签名 WHERE 文件 = ?", (processed_path,)).fetchone()
+        if stored is None or not os.path.exists(processed_path):
+            return False
+        signature = file_signature(processed_path)
+        return stored == (signature["size"], signature["mtime_ns"])
+
+    def summary(self, processed_paths):
+        """
+        一条SQL按学生汇总多个处理后文件的统计分，返回DataFrame(姓名, 学号, 参与文件数, 统计分总分)，
+        学生按第一次出现的文件和行排列（与按文件顺序合并后groupby的顺序一致）
+        """
+        self.conn.execute("CREATE TEMP TABLE IF NOT EXISTS 汇总文件 (文件 TEXT PRIMARY KEY, 序号 INTEGER NOT NULL)")
+        with self.conn:
+            self.conn.execute("DELETE FROM 汇总文件")
+            self.conn.executemany("INSERT OR IGNORE INTO 汇总文件 VALUES (?, ?)",
+                                  [(path, index) for index, path in enumerate(processed_paths)])
+        return pd.read_sql_query("""
+            SELECT 成绩.姓名, 成绩.学号, COUNT(DISTINCT 成绩.文件) AS 参与文件数, SUM(成绩.统计分) AS 统计分总分
+            FROM 成绩 JOIN 汇总文件 ON 成绩.文件 = 汇总文件.文件
+            GROUP BY 成绩.姓名, 成绩.学号
+            ORDER BY MIN(汇总文件.序号 * 4294967296 + 成绩.行号)
+        """, self.conn)
+
+    def student_history(self, student_id):
+        """某个学生的历次成绩（按学号索引查询）"""
+        return pd.read_sql_query(
+            "SELECT 作业, 姓名, 实际得分, 得分率, 统计分, 满分 FROM 成绩 WHERE 学号 = ? ORDER BY 作业, 行号",
+            self.conn, params=(student_id,))
+
+
+class ScoreStats:
+    """
+    一个文件（或多个文件合并后）的分数分布累加器，可逐块更新、可相互合并，分块/并行处理的结果与整表一次计算一致：
+    人数、缺考人数、参考学生实际得分的和/平方和/最低/最高、得分率之和，
+    得分率的「取值-人数」表（求分位数用，不同取值超过STATS_SKETCH_SIZE个后按1/STATS_SKETCH_SIZE取整），
+    以及按分数段规则的各分数段人数（固定分箱的直方图，含未覆盖、无得分率两箱）
+    多个文件合并时只合并这些累加量，不需要重新读取数据；满分不同的文件合并后不再给出按分数计的分位数
+    """
+
+    def __init__(self, segment_count=0, full_score=None):
+        self.full_score = full_score
+        self.rows = 0
+        self.absent = 0
+        self.score_sum = 0.0
+        self.score_square_sum = 0.0
+        self.score_min = None
+        self.score_max = None
+        self.rate_sum = 0.0
+        self.rate_values = np.empty(0, dtype=float)
+        self.rate_counts = np.empty(0, dtype=np.int64)
+        self.rounded = False  # 得分率取值已按1/STATS_SKETCH_SIZE取整
+        self.segment_counts = np.zeros(segment_count + 2, dtype=np.int64)
+
+    def update(self, scores, rates, absent, segment_ids):
+        """
+        累加一批数据（一个文件或分块处理时的一块）
+        :param scores: 实际得分；rates: 得分率；absent: 缺考掩码；segment_ids: 每行所在的分数段序号（SegmentTable.segment_of）
+        """
+        present = ~absent
+        self.rows += len(scores)
+        self.absent += int(absent.sum())
+        self.segment_counts += np.bincount(segment_ids, minlength=len(self.segment_counts))
+        scores = scores[present]
+        if len(scores):
+            self.score_sum += float(scores.sum())
+            self.score_square_sum += float(np.square(scores).sum())
+            low, high = float(scores.min()), float(scores.max())
+            self.score_min = low if self.score_min is None else min(self.score_min, low)
+            self.score_max = high if self.score_max is None else max(self.score_max, high)
+        rates = rates[present]
+        rates = rates[~np.isnan(rates)]
+        self.rate_sum += float(rates.sum())
+        self.add_rates(*np.unique(rates, return_counts=True))
+
+    def add_rates(self, values, counts):
+        """把「取值-人数」合并进来，不同取值过多时统一取整，先取整还是后取整结果相同"""
+        values = np.concatenate([self.rate_values, values])
+        counts = np.concatenate([self.rate_counts, counts])
+        while True:
+            if self.rounded:
+                values = np.round(values * STATS_SKETCH_SIZE) / STATS_SKETCH_SIZE
+            self.rate_values, inverse = np.unique(values, return_inverse=True)
+            self.rate_counts = np.bincount(inverse, weights=counts, minlength=len(self.rate_values)).astype(np.int64)
+            if self.rounded or len(self.rate_values) <= STATS_SKETCH_SIZE:
+                return
+            self.rounded = True
+
+    def merge(self, other):
+        """合并另一个累加器（另一个文件或并行处理时另一个进程的结果）"""
+        if self.rows == 0:
+            self.full_score = other.full_score
+        elif other.rows and other.full_score != self.full_score:
+            self.full_score = None
+        self.rows += other.rows
+        self.absent += other.absent
+        self.score_sum += other.score_sum
+        self.score_square_sum += other.score_square_sum
+        for bound, pick in (("score_min", min), ("score_max", max)):
+            values = [value for value in (getattr(self, bound), getattr(other, bound)) if value is not None]
+            setattr(self, bound, pick(values) if values else None)
+        self.rate_sum += other.rate_sum
+        self.rounded = self.rounded or other.rounded
+        self.add_rates(other.rate_values, other.rate_counts)
+        if len(other.segment_counts) == len(self.segment_counts):
+            self.segment_counts += other.segment_counts
+
+    @classmethod
+    def combine(cls, stats_list, segment_count=0):
+        """合并多个文件的累加器，得到整批（课程）的分布"""
+        total = cls(segment_count)
+        for stats in stats_list:
+            total.merge(stats)
+        return total
+
+    def rate_quantiles(self, quantiles):
+        """得分率的分位数（与numpy.quantile默认的线性插值一致）"""
+        present = int(self.rate_counts.sum())
+        if not present:
+            return [None] * len(quantiles)
+        ends = np.cumsum(self.rate_counts)
+        result = []
+        for q in quantiles:
+            position = (present - 1) * q
+            low = int(np.floor(position))
+            low_value = self.rate_values[np.searchsorted(ends, low, side="right")]
+            high_value = self.rate_values[np.searchsorted(ends, min(low + 1, present - 1), side="right")]
+            result.append(float(low_value + (position - low) * (high_value - low_value)))
+        return result
+
+    def report_row(self, name, segments):
+        """分布统计表中的一行：分数按参考（非缺考）学生计算，分数段人数按全部学生计算"""
+        present = self.rows - self.absent
+        mean = self.score_sum / present if present else None
+        row = {
+            "文件": name,
+            "满分": self.full_score,
+            "人数": self.rows,
+            "缺考人数": self.absent,
+            "平均分": round(mean, 2) if present else None,
+            "标准差": round(max(self.score_square_sum / present - mean ** 2, 0.0) ** 0.5, 2) if present else None,
+            "最低分": self.score_min,
+            "最高分": self.score_max,
+        }
+        rates = self.rate_quantiles(list(STATS_PERCENTILES.values()))
+        for label, rate in zip(STATS_PERCENTILES, rates):
+            row[label] = round(rate * self.full_score, 2) if rate is not None and self.full_score else None
+        row["平均得分率"] = round(self.rate_sum / present, 4) if present else None
+        for (min_rate, max_rate, _), count in zip(segments, self.segment_counts):
+            row[f"[{min_rate:g}, {max_rate:g}]人数"] = int(count)
+        row["未覆盖人数"] = int(self.segment_counts[len(segments):].sum())
+        return row
+
+    def to_dict(self):
+        """转为可写入增量清单（JSON）的字典"""
+        return {
+            "full_score": self.full_score, "rows": self.rows, "absent": self.absent,
+            "score_sum": self.score_sum, "score_square_sum": self.score_square_sum,
+            "score_min": self.score_min, "score_max": self.score_max, "rate_sum": self.rate_sum,
+            "rate_values": self.rate_values.tolist(), "rate_counts": self.rate_counts.tolist(),
+            "rounded": self.rounded, "segment_counts": self.segment_counts.tolist(),
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        stats = cls()
+        for key, value in data.items():
+            setattr(stats, key, value)
+        stats.rate_values = np.array(data["rate_values"], dtype=float)
+        stats.rate_counts = np.array(data["rate_counts"], dtype=np.int64)
+        stats.segment_counts = np.array(data["segment_counts"], dtype=np.int64)
+        return stats
+
+
+class StageTimer:
+    """
+    分环节计时：按(文件, 环节)累计耗时和处理行数，分块处理时同一环节的多次计时累加；
+    并行处理时子进程的计时记录合并到主进程；多线程扫描表头时各线程同时累加，累加时加锁
+    """
+
+    def __init__(self):
+        self.records = {}  # {(文件路径, 环节): [耗时秒数, 行数]}
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, file_path, name, rows=0):
+        """计时一个环节，可在with块内设置返回值的rows为处理的行数"""
+        record = SimpleNamespace(rows=rows)
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            self.add(file_path, name, time.perf_counter() - start, record.rows)
+
+    def add(self, file_path, name, seconds, rows=0):
+        with self.lock:
+            record = self.records.setdefault((file_path, name), [0.0, 0])
+            record[0] += seconds
+            record[1] += rows
+
+    def merge(self, records):
+        for (file_path, name), (seconds, rows) in records.items():
+            self.add(file_path, name, seconds, rows)
+
+    def rows(self):
+        """逐文件逐环节的明细：[{文件, 环节, 耗时秒, 行数, 行每秒}, ...]"""
+        return [
+            {"文件": os.path.basename(file_path), "环节": name, "耗时秒": round(seconds, 6), "行数": rows,
+             "行每秒": round(rows / seconds) if rows and seconds else None}
+            for (file_path, name), (seconds, rows) in self.records.items()
+        ]
+
+    def stage_totals(self):
+        """按环节合计（保持环节第一次出现的顺序）：{环节: [文件数, 耗时秒数, 行数]}"""
+        totals = {}
+        for (_, name), (seconds, rows) in self.records.items():
+            total = totals.setdefault(name, [0, 0.0, 0])
+            total[0] += 1
+            total[1] += seconds
+            total[2] += rows
+        return totals
+
+    def summary_lines(self, elapsed):
+        """
+        日志中的耗时汇总表，占比为占整个任务耗时的比例
+        （读取嵌套在汇总读取中、并行时各进程的耗时相加，占比之和可能超过100%）
+        """
+        lines = [f"{'环节':　<6}{'文件数':>6}{'耗时(秒)':>10}{'行数':>12}{'行/秒':>12}{'占比':>7}"]
+        for name, (files, seconds, rows) in self.stage_totals().items():
+            speed = f"{rows / seconds:,.0f}" if rows and seconds else "-"
+            lines.append(f"{name:　<6}{files:>6}{seconds:>10.3f}{rows or '-':>12}{speed:>12}"
+                         f"{seconds / elapsed if elapsed else 0:>7.0%}")
+        return lines
+
+
+def open_log_file(path, name):
+    """
+    按大小轮转的日志文件：超过LOG_FILE_MAX_BYTES后改名为.1、.2……，最多保留LOG_FILE_BACKUPS份
+    :return: 只写入该文件的logging.Logger（不向上传播，不会输出到控制台）
+    """
+    import logging
+    from logging.handlers import RotatingFileHandler
+
+    handler = RotatingFileHandler(path, maxBytes=LOG_FILE_MAX_BYTES, backupCount=LOG_FILE_BACKUPS, encoding='utf-8')
+    handler.setFormatter(logging.Formatter("%(asctime)s %(message)s", "%Y-%m-%d %H:%M:%S"))
+    logger = logging.getLogger(name)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    for old in logger.handlers[:]:
+        logger.removeHandler(old)
+        old.close()
+    logger.addHandler(handler)
+    return logger
+
+
+def format_bytes(size):
+    """字节数转为便于阅读的KB/MB"""
+    if size >= 1024 * 1024:
+        return f"{size / 1024 / 1024:.1f} MB"
+    return f"{size / 1024:.1f} KB"
+
+
+def process_file_worker(file_path, settings, full_score, encoding="", score_column=""):
+    """
+    进程池中处理单个文件，只接收纯数据（路径、列名、规则、满分、已知编码、该文件的总分列），不回调主进程
+    :return: {"logs": [...], "file_info": {...}, "processed_path": ...} 或 {"logs": [...], "error": ..., "traceback": ...}
+    """
+    logs = []
+    settings = dict(settings)
+    score_segments = settings.pop("score_segments")
+    rule_sets = settings.pop("rule_sets")
+    engine = ScoreEngine(log=logs.append, **settings)
+    engine.set_segments(score_segments, report=False)
+    engine.set_rule_sets(rule_sets, report=False)
+    engine.init_file_info(file_path).update(encoding=encoding, score_column=score_column)
+    try:
+        processed_path = engine.process_file(file_path, full_score=full_score)
+        info = engine.file_info[file_path]
+        return {"logs": logs, "processed_path": processed_path, "result": engine.results[processed_path],
+                "file_info": {key: info[key] for key in FILE_INFO_RESULT_KEYS if key in info},
+                "timings": engine.timer.records}
+    except Exception as e:
+        return {"logs": logs, "error": str(e), "traceback": traceback.format_exc(), "timings": engine.timer.records}
+
+
+class ScoreEngine:
+    """
+    成绩统计引擎：给定文件路径、列名、表头跳过行数、分数段规则和满分，完成统计分计算与汇总
+    不弹任何窗口，日志通过log回调输出（默认打印到控制台），需要人工输入满分时调用ask_full_score回调
+    """
+
+    def __init__(self, name_column="", id_column="", score_column="", score_segments=None, skip_rows=0,
+                 full_scores=None, default_full_score=None, log=None, ask_full_score=None, file_info=None,
+                 workers=1, progress=None, cancel_event=None, results=None, incremental=False, chunk_size=0,
+                 compact_output=False, output_format="", db_path="", timing_report=False, profile=False,
+                 verbose=False, rule_sets=None, csv_engine="auto"):
+        """
+        :param score_segments: 分数段规则 [(min_rate, max_rate, score), ...]
+        :param full_scores: 指定文件的满分 {文件路径或文件名: 满分}，优先于从列名提取
+        :param default_full_score: 列名中提取不到满分时使用的默认满分
+        :param log: 日志回调 log(msg)
+        :param ask_full_score: 满分询问回调 ask_full_score(score_column_name, file_name)，返回None表示取消
+        :param file_info: 文件信息字典，传入时与调用方共享
+        :param workers: 并行处理的进程数，1表示在当前进程逐个处理
+        :param progress: 进度回调 progress(已完成文件数, 文件总数, 已处理行数)
+        :param cancel_event: threading.Event，置位后在文件之间停止批处理
+        :param results: 各处理后文件的精简结果 {处理后文件路径: DataFrame(姓名, 学号, 统计分)}，传入时与调用方共享
+        :param incremental: 增量处理，跳过源文件和处理设置都未变化的文件（清单保存在源文件所在目录）
+        :param chunk_size: 大于0时CSV文件按此行数分块流式处理
+        :param compact_output: 精简输出，处理后文件只保留姓名/学号/总分列和计算出的三列，读取时只解析这三列
+        :param output_format: 处理后文件和汇总文件的格式，为空时与原文件相同（汇总为CSV），可选parquet/feather
+        :param db_path: 成绩库（SQLite）路径，非空时每个文件处理完成后把逐个学生的结果写入成绩库，汇总用SQL完成
+        :param timing_report: 在输出目录写出逐文件逐环节的耗时报告（JSON和CSV）
+        :param profile: 用cProfile和tracemalloc分析每次统计/汇总，结果保存在输出目录
+        :param verbose: 详细日志，同时输出每个文件使用的编码、读取的列等细节（默认不输出）
+        :param rule_sets: 对比规则 {名称: 分数段规则}，每套规则另外输出一列「统计分_名称」，汇总时并列输出各自的总分
+        :param csv_engine: CSV解析引擎，CSV_ENGINES中的一种：auto（默认）有pyarrow时用pyarrow多线程解析，否则用pandas
+        """
+        self.name_column = name_column
+        self.id_column = id_column
+        self.score_column = score_column
+        self.skip_rows = skip_rows
+        self.full_scores = full_scores or {}
+        self.default_full_score = default_full_score
+        self.log_func = log
+        self.ask_full_score = ask_full_score
+        self.workers = max(1, workers or 1)
+        self.progress = progress
+        self.cancel_event = cancel_event
+        self.cancelled = False
+        self.incremental = incremental
+        self.chunk_size = chunk_size or 0
+        self.compact_output = compact_output
+        self.output_format = output_format or ""
+        self.db_path = db_path or ""
+        self.timing_report = timing_report
+        self.profile = profile
+        self.verbose = verbose
+        self.csv_engine = csv_engine or "auto"
+        self.timer = StageTimer()
+        self.manifest = ProcessingManifest()
+
+        self.file_info = file_info if file_info is not None else {}
+        self.results = results if results is not None else {}
+        self.processed_paths = []
+        self.errors = []  # 处理失败的文件：[(文件路径, 错误信息), ...]
+
+        self.score_segments = []
+        self.segment_table = None
+        self.rule_sets = {}
+        self.rule_table = None  # 当前规则+对比规则合并编译的查找表，没有对比规则时为None
+        if score_segments is not None:
+            self.set_segments(score_segments)
+        if rule_sets:
+            self.set_rule_sets(rule_sets)
+
+    def log(self, msg):
+        if self.log_func is not None:
+            self.log_func(msg)
+        else:
+            print(f"{datetime.now().strftime('[%H:%M:%S]')} {msg}")
+
+    def debug(self, msg):
+        """细节日志（编码检测、逐文件读取方式等），只在详细日志模式下输出"""
+        if self.verbose:
+            self.log(msg)
+
+    def set_segments(self, score_segments, report=True):
+        """编译分数段规则，重叠/未覆盖的得分率区间在编译时提示一次"""
+        self.score_segments = list(score_segments)
+        self.segment_table = SegmentTable(self.score_segments)
+        self.compile_rule_sets()
+        if not report:
+            return
+        self.log(f"得分率-分数段规则：{self.score_segments}")
+        if self.segment_table.overlaps:
+            self.log(f"提示：分数段存在重叠 {self.segment_table.overlaps}，重叠部分按靠前的分数段计分")
+        if self.segment_table.gaps:
+            self.log(f"提示：以下得分率区间未被任何分数段覆盖，统计分记为0：{'、'.join(self.segment_table.gaps)}")
+
+    def set_rule_sets(self, rule_sets, report=True):
+        """
+        设置对比规则 {名称: 分数段规则}（为空时取消对比），与当前规则合并编译，
+        处理时只定位一次得分率所在的片段，就同时得到各套规则的统计分，不需要为每套规则重新读取文件
+        """
+        self.rule_sets = {name: list(segments) for name, segments in (rule_sets or {}).items()}
+        self.compile_rule_sets()
+        if not report or self.rule_table is None:
+            return
+        for table, (name, segments) in zip(self.rule_table.tables[1:], self.rule_sets.items()):
+            self.log(f"对比规则「{name}」：{segments}")
+            if table.overlaps:
+                self.log(f"提示：对比规则「{name}」分数段存在重叠 {table.overlaps}，重叠部分按靠前的分数段计分")
+            if table.gaps:
+                self.log(f"提示：对比规则「{name}」以下得分率区间未被覆盖，统计分记为0：{'、'.join(table.gaps)}")
+
+    def compile_rule_sets(self):
+        if self.rule_sets and self.score_segments:
+            self.rule_table = RuleSetTable([self.score_segments, *self.rule_sets.values()])
+        else:
+            self.rule_table = None
+
+    def rule_columns(self):
+        """各对比规则的统计分列名：统计分_名称"""
+        return [f"统计分_{name}" for name in self.rule_sets]
+
+    def report_progress(self, done, total, rows):
+        if self.progress is not None:
+            self.progress(done, total, rows)
+
+    def check_cancelled(self, remaining):
+        """文件之间检查是否已请求取消"""
+        if self.cancel_event is None or not self.cancel_event.is_set():
+            return False
+        if not self.cancelled:
+            self.cancelled = True
+            self.log(f"任务已取消，剩余 {remaining} 个文件未处理")
+        return True
+
+    @contextmanager
+    def instrumented_run(self, kind):
+        """
+        一次统计/汇总任务的计时：开始时清空分环节计时，结束时在日志中输出耗时汇总表，
+        开启耗时报告时在输出目录写出JSON/CSV报告，开启性能分析时用cProfile和tracemalloc记录这一次任务
+        任务中设置返回值的folder为输出目录
+        """
+        self.timer = StageTimer()
+        run = SimpleNamespace(folder="")
+        profiler = None
+        if self.profile:
+            import cProfile
+            import tracemalloc
+
+            if self.workers > 1:
+                self.log("提示：性能分析只记录主进程，需要分析文件处理时请使用1个进程")
+            tracemalloc.start()
+            profiler = cProfile.Profile()
+            profiler.enable()
+        start = time.perf_counter()
+        try:
+            yield run
+        finally:
+            elapsed = time.perf_counter() - start
+            if profiler is not None:
+                profiler.disable()
+            self.log(f"=== {kind}耗时汇总（总耗时 {elapsed:.3f} 秒）===")
+            for line in self.timer.summary_lines(elapsed):
+                self.log(line)
+            try:
+                if self.timing_report and run.folder:
+                    self.write_timing_report(kind, run.folder, elapsed)
+                if profiler is not None:
+                    self.write_profile(kind, run.folder or os.getcwd(), profiler)
+            except OSError as e:
+                self.log(f"保存耗时报告/性能分析失败：{e}")
+            finally:
+                if profiler is not None:
+                    tracemalloc.stop()
+
+    def write_timing_report(self, kind, folder, elapsed):
+        """逐文件逐环节的耗时报告：JSON（含按环节合计）和CSV各一份"""
+        base = os.path.join(folder, f"{TIMING_REPORT_NAME}_{kind}")
+        details = self.timer.rows()
+        with open(base + ".json", 'w', encoding='utf-8') as f:
+            json.dump({
+                "任务": kind,
+                "时间": datetime.now().isoformat(timespec="seconds"),
+                "总耗时秒": round(elapsed, 6),
+                "环节合计": [{"环节": name, "文件数": files, "耗时秒": round(seconds, 6), "行数": rows}
+                             for name, (files, seconds, rows) in self.timer.stage_totals().items()],
+                "明细": details,
+            }, f, ensure_ascii=False, indent=1)
+        with open(base + ".csv", 'w', encoding='utf-8-sig', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=["文件", "环节", "耗时秒", "行数", "行每秒"])
+            writer.writeheader()
+            writer.writerows(details)
+        self.log(f"耗时报告已保存至：{base}.json / .csv")
+
+    def write_profile(self, kind, folder, profiler):
+        """保存cProfile结果（.prof，可用snakeviz等工具查看）和文本摘要（耗时最多的函数、内存分配最多的代码行）"""
+        import pstats
+        import tracemalloc
+
+        base = os.path.join(folder, f"{PROFILE_FILE_NAME}_{kind}")
+        profiler.dump_stats(base + ".prof")
+        current, peak = tracemalloc.get_traced_memory()
+        top_lines = tracemalloc.take_snapshot().statistics("lineno")[:20]
+        with open(base + ".txt", 'w', encoding='utf-8') as f:
+            f.write(f"内存：当前 {format_bytes(current)}，峰值 {format_bytes(peak)}\n\n内存分配最多的代码行：\n")
+            for stat in top_lines:
+                f.write(f"{stat}\n")
+            f.write("\n累计耗时最多的函数：\n")
+            pstats.Stats(profiler, stream=f).sort_stats("cumulative").print_stats(40)
+        self.log(f"性能分析已保存至：{base}.prof / .txt（内存峰值 {format_bytes(peak)}）")
+
+    def init_file_info(self, file_path):
+        if file_path not in self.file_info:
+            self.file_info[file_path] = {"columns": [], "encoding": "", "processed_path": "", "full_score": 0}
+        return self.file_info[file_path]
+
+    @staticmethod
+    def decode_strict(raw, encoding, partial=False):
+        """严格解码，失败返回None；partial为True时允许末尾有被截断的多字节字符"""
+        try:
+            if partial:
+                return codecs.getincrementaldecoder(encoding)().decode(raw, final=False)
+            return raw.decode(encoding)
+        except (UnicodeDecodeError, LookupError):
+            return None
+
+    def encoding_candidates(self, head, hint=None):
+        """
+        候选编码顺序：BOM > utf-8 > 上次成功的编码 > gbk，都不行时才用chardet检测，最后退回latin-1
+        （utf-8解码遇到第一个非法字节就会失败，放在缓存编码之前几乎没有开销，且能避免把utf-8误读成gbk）
+        """
+        if head.startswith(codecs.BOM_UTF8):
+            candidates = ['utf-8-sig']
+        elif head.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+            candidates = ['utf-16']
+        else:
+            candidates = []
+        candidates.append('utf-8')
+        if hint and hint != "excel":
+            candidates.append(hint)
+        candidates.append('gbk')
+        yield from dict.fromkeys(candidates)
+
+        import chardet  # 只在常见编码都失败时才需要，延迟导入以加快启动
+
+        detected = chardet.detect(head[:ENCODING_DETECT_SIZE])['encoding']
+        self.debug(f"utf-8/gbk解码失败，chardet检测编码为：{detected}")
+        yield from filter(None, [detected, 'latin-1'])
+
+    def choose_encoding(self, raw, hint=None, partial=False):
+        """
+        在内存中确定编码（候选顺序见encoding_candidates）
+        :return: (编码, 解码后的文本)
+        """
+        for enc in self.encoding_candidates(raw, hint):
+            text = self.decode_strict(raw, enc, partial)
+            if text is not None:
+                return enc, text
+        raise ValueError("无法确定文件编码")
+
+    def choose_stream_encoding(self, file_path, hint=None):
+        """
+        分块读取大文件时确定编码：按块增量解码校验整个文件，内存占用只有一块的大小
+        """
+        with open(file_path, 'rb') as f:
+            head = f.read(HEADER_SAMPLE_SIZE)
+            for enc in self.encoding_candidates(head, hint):
+                try:
+                    decoder = codecs.getincrementaldecoder(enc)()
+                except LookupError:
+                    continue
+                f.seek(0)
+                try:
+                    for block in iter(lambda: f.read(STREAM_BLOCK_SIZE), b''):
+                        decoder.decode(block)
+                    decoder.decode(b'', final=True)
+                    return enc
+                except UnicodeDecodeError:
+                    continue
+        raise ValueError("无法确定文件编码")
+
+    def try_read_csv(self, file_path, skip_rows, is_full_read=False, usecols=None):
+        """
+        增强版CSV读取：文件只从磁盘读一次，在内存中确定编码后只解析一次
+        表头读取只取文件开头一段；确定的编码记录在file_info中，后续完整读取直接复用
+        :param usecols: 完整读取时只解析的列（同read_csv的usecols）
+        """
+        with self.timer.stage(file_path, "读取文件"), open(file_path, 'rb') as f:
+            raw = f.read() if is_full_read else f.read(HEADER_SAMPLE_SIZE)
+            # 开头一段不足以包含完整表头时（极少见）改为读取整个文件
+            partial = not is_full_read and len(raw) == HEADER_SAMPLE_SIZE
+            if partial and raw.count(b'\n') <= skip_rows:
+                raw += f.read()
+                partial = False
+
+        info = self.file_info.get(file_path)
+        with self.timer.stage(file_path, "编码检测"):
+            enc, text = self.choose_encoding(raw, info["encoding"] if info else None, partial)
+        parsed = []
+        try:
+            if is_full_read:
+                with self.timer.stage(file_path, "解析") as stage:
+                    df = next(self.iter_csv_chunks(io.StringIO(text), skip_rows, usecols=usecols, parsed=parsed))
+                    stage.rows = len(df)
+            else:
+                # 表头只有一行，始终用pandas解析，列名规则（Unnamed: n、重复列名加.1）与完整读取一致
+                with self.timer.stage(file_path, "读取表头"):
+                    df = pd.read_csv(io.StringIO(text), skiprows=skip_rows, nrows=0)
+        except Exception as e:
+            raise ValueError(f"无法读取文件（编码 {enc}）：{file_path}，{str(e)[:100]}")
+        if info is not None:
+            info["encoding"] = enc
+        if parsed:
+            self.log_csv_engine(file_path, parsed)
+        self.debug(f"使用编码 {enc} 成功读取文件：{os.path.basename(file_path)}")
+        return df, enc
+
+    @staticmethod
+    def csv_data_options(skip_rows):
+        """
+        读取CSV数据的参数：原有列一律按文本读取，写出时保持原样（学号前导0等不会被改写），
+        也保证每行的结果与其他行无关，分块读取和整表读取的输出逐字节一致
+        """
+        return {"skiprows": skip_rows, "on_bad_lines": 'skip', "dtype": str}
+
+    @staticmethod
+    def read_csv_record(source):
+        """从文本流读取一条完整记录（引号内的换行按引号奇偶判断，不会拆开一条记录）"""
+        record, in_quotes = [], False
+        while True:
+            line = source.readline()
+            if not line:
+                break
+            record.append(line)
+            in_quotes ^= line.count('"') % 2 == 1
+            if not in_quotes:
+                break
+        return ''.join(record)
+
+    def iter_csv_chunks(self, source, skip_rows, chunk_size=0, usecols=None, parsed=None):
+        """
+        解析CSV文本流，chunk_size大于0时按完整记录切块，每块连同表头单独交给read_csv解析，否则整表一次解析
+        每块在表头后插入一行字段数正确的空行再去掉：read_csv遇到第一条数据就是多字段坏行时，
+        会把第一列当成索引而不是跳过该行，插入空行后无论整表还是分块，坏行都按同样的规则跳过，
+        结果逐行一致（pandas自带的chunksize在on_bad_lines='skip'时也不能保证这一点）
+        使用pyarrow时每块先交给parse_csv_arrow多线程解析，有坏行等pyarrow处理不了的块再按上面的方式用pandas解析
+        只有表头时返回一个空表；usecols只影响返回哪些列，坏行仍按全部字段数判断
+        :param parsed: 传入列表时每块追加(解析引擎, 改用pandas的原因)，用于记录每个文件实际使用的引擎
+        """
+        # 表头部分：跳过的行 + 表头（表头前的空行按read_csv的规则一并跳过）
+        header_parts = [self.read_csv_record(source) for _ in range(skip_rows)]
+        while True:
+            record = self.read_csv_record(source)
+            header_parts.append(record)
+            if not record or record.strip('\r\n'):
+                break
+        header_text = ''.join(header_parts)
+        if header_text and not header_text.endswith(('\n', '\r')):
+            header_text += '\n'
+        options = self.csv_data_options(skip_rows)
+        columns = pd.read_csv(io.StringIO(header_text), nrows=0, **options).columns.tolist()
+        placeholder = ',' * (len(columns) - 1) + '\n'
+        # 只有一列时占位行是空行，会被pandas当作空行跳过，这种文件仍用pandas解析以保持与原有结果一致
+        use_arrow = self.csv_reader() == "pyarrow" and len(columns) > 1
+        if parsed is None:
+            parsed = []
+
+        def parse(body):
+            fallback = ""
+            if use_arrow:
+                try:
+                    df = self.parse_csv_arrow(body, columns, usecols)
+                    parsed.append(("pyarrow", ""))
+                    return df
+                except ValueError as e:
+                    fallback = str(e)
+            df = pd.read_csv(io.StringIO(header_text + placeholder + body), usecols=usecols, **options)
+            parsed.append(("pandas", fallback))
+            return df.iloc[1:].reset_index(drop=True)
+
+        if not chunk_size:
+            yield parse(source.read())
+            return
+        body, chunk_count = [], 0
+        for record in iter(lambda: self.read_csv_record(source), ''):
+            body.append(record)
+            if len(body) >= chunk_size:
+                yield parse(''.join(body))
+                body, chunk_count = [], chunk_count + 1
+        if body or not chunk_count:
+            yield parse(''.join(body))
+
+    def csv_reader(self):
+        """实际使用的CSV解析引擎：auto在装有pyarrow时为pyarrow，否则为pandas"""
+        if self.csv_engine == "auto":
+            return "pyarrow" if importlib.util.find_spec("pyarrow") else "pandas"
+        return self.csv_engine
+
+    @staticmethod
+    def parse_csv_arrow(body, columns, usecols=None):
+        """
+        用pyarrow多线程解析CSV的数据部分（不含表头），结果与pandas按dtype=str读取逐单元格一致：
+        列按位置命名、全部按文本读取，空值文本与pandas默认相同（含带引号的空值），最后换成pandas解析表头得到的列名
+        字段数与表头不一致的行（pandas要按on_bad_lines跳过或补空）、无法转为UTF-8的文本等情况抛出ValueError，
+        由调用方改用pandas解析
+        """
+        import pyarrow as pa
+        import pyarrow.csv as pv
+
+        names = [f"f{i}" for i in range(len(columns))]
+        wanted = usecols if callable(usecols) or usecols is None else set(usecols).__contains__
+        selected = {name: col for name, col in zip(names, columns) if usecols is None or wanted(col)}
+        if not selected:  # pyarrow的include_columns为空表示读取全部列
+            raise ValueError("没有需要读取的列")
+        try:
+            table = pv.read_csv(
+                io.BytesIO(body.encode('utf-8')),
+                read_options=pv.ReadOptions(column_names=names, use_threads=True),
+                parse_options=pv.ParseOptions(newlines_in_values=True),
+                convert_options=pv.ConvertOptions(
+                    column_types={name: pa.string() for name in names}, null_values=CSV_NA_VALUES,
+                    strings_can_be_null=True, quoted_strings_can_be_null=True, include_columns=list(selected)))
+        except (pa.ArrowInvalid, UnicodeEncodeError) as e:
+            raise ValueError(str(e).splitlines()[0][:100])
+        df = table.to_pandas()
+        df.columns = list(selected.values())
+        if (df.dtypes == object).any():  # 旧版pandas中文本列为object，空值统一为NaN（与read_csv一致）
+            df = df.where(df.notna(), np.nan)
+        return df
+
+    def log_csv_engine(self, file_path, parsed):
+        """输出一个文件实际使用的CSV解析引擎（分块处理时个别块可能改用pandas），并记录到file_info"""
+        engines = "、".join(dict.fromkeys(engine for engine, _ in parsed))
+        reasons = [reason for _, reason in parsed if reason]
+        info = self.file_info.get(file_path)
+        if info is not None:
+            info["csv_engine"] = engines
+        msg = f"文件 {os.path.basename(file_path)} 使用 {engines} 解析"
+        if reasons:
+            msg += f"（{len(reasons)}/{len(parsed)} 块pyarrow无法解析，改用pandas：{reasons[0]}）"
+        self.log(msg)
+
+    def read_columns(self, file_path):
+        """只读表头，返回(列名列表, 编码)，并记录到file_info"""
+        info = self.init_file_info(file_path)
+        if file_path.endswith('.csv'):
+            df, encoding = self.try_read_csv(file_path, self.skip_rows)
+        else:
+            with self.timer.stage(file_path, "读取表头"):
+                df = pd.DataFrame(columns=read_excel_columns(file_path, self.skip_rows))
+            encoding = "excel"
+        columns = df.columns.tolist()
+        info["columns"] = columns
+        info["encoding"] = encoding
+        return columns, encoding
+
+    def scan_files(self, file_paths):
+        """
+        多线程并行只读所有文件的表头，编码和列名记录在file_info中（读取失败或没有读到任何列名的记录scan_error），
+        并按列名签名分组：列名完全相同的文件为一组，使用的列和存在的问题也相同
+        :return: {列名元组: [文件路径, ...]}，按file_paths顺序，读取失败的文件不在任何一组
+        """
+        def scan(file_path):
+            self.init_file_info(file_path).pop("scan_error", None)
+            try:
+                columns, _ = self.read_columns(file_path)
+            except Exception as e:
+                self.file_info[file_path]["scan_error"] = str(e)
+                return
+            if not columns:  # 如表头行为空、跳过行数超过了数据行数
+                self.file_info[file_path]["scan_error"] = "未读取到表头，请检查跳过行数"
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=max(1, min(SCAN_WORKERS, len(file_paths)))) as executor:
+            list(executor.map(scan, file_paths))
+
+        groups = {}
+        for file_path in file_paths:
+            info = self.file_info[file_path]
+            if "scan_error" not in info:
+                groups.setdefault(tuple(info["columns"]), []).append(file_path)
+        self.log(f"表头扫描完成：{len(file_paths)} 个文件，{len(groups)} 种列名组合"
+                 f"（{time.perf_counter() - start:.2f}秒）")
+        for index, paths in enumerate(groups.values(), start=1):
+            schema = self.file_schema(paths[0])
+            names = "、".join(os.path.basename(path) for path in paths[:3]) + ("等" if len(paths) > 3 else "")
+            self.log(f"  组{index}：{len(paths)} 个文件（{names}），总分列「{schema['score_column']}」，"
+                     f"满分 {schema['full_score'] if schema['full_score'] is not None else '未知'}")
+        issues = self.schema_issues(file_paths)
+        if issues:
+            self.log(f"  其中 {len(issues)} 个文件需要处理：" +
+                     "；".join(f"{os.path.basename(path)} {'，'.join(items)}" for path, items in issues.items()))
+        return groups
+
+    def file_score_column(self, file_path):
+        """
+        该文件使用的总分列：手动指定的（file_info中的score_column）优先；
+        所选总分列不在该文件的表头中时（如各次作业满分不同：总分(80)、总分(100)），改用该文件表头自动匹配到的总分列
+        """
+        info = self.file_info.get(file_path) or {}
+        if info.get("score_column"):
+            return info["score_column"]
+        columns = info.get("columns")
+        if not columns or self.score_column in columns:
+            return self.score_column
+        return match_columns(columns)[2] or self.score_column
+
+    def file_schema(self, file_path):
+        """
+        扫描得到的文件信息：编码、列名、使用的总分列、不询问时能确定的满分（确定不了为None）和问题列表
+        问题包括：读取表头失败、缺少姓名/学号列、找不到总分列、无法确定满分
+        """
+        info = self.file_info.get(file_path) or {}
+        columns = info.get("columns") or []
+        schema = {"encoding": info.get("encoding", ""), "columns": columns,
+                  "score_column": self.file_score_column(file_path), "full_score": None, "issues": []}
+        if info.get("scan_error"):
+            schema["issues"].append(f"读取表头失败：{info['scan_error']}")
+            return schema
+        for label, col in (("姓名列", self.name_column), ("学号列", self.id_column)):
+            if col not in columns:
+                schema["issues"].append(f"缺少{label}「{col}」")
+        if schema["score_column"] not in columns:
+            schema["issues"].append("找不到总分列")
+        else:
+            schema["full_score"] = self.known_full_score(schema["score_column"], file_path)
+            if schema["full_score"] is None:
+                schema["issues"].append(f"无法从列名「{schema['score_column']}」确定满分")
+        return schema
+
+    def schema_issues(self, file_paths):
+        """已扫描过表头的文件中存在问题的文件：{文件路径: [问题, ...]}，未扫描的文件不检查"""
+        issues = {}
+        for file_path in file_paths:
+            info = self.file_info.get(file_path) or {}
+            if info.get("columns") or info.get("scan_error"):
+                items = self.file_schema(file_path)["issues"]
+                if items:
+                    issues[file_path] = items
+        return issues
+
+    def read_file(self, file_path, skip_rows=None, usecols=None):
+        """
+        完整读取成绩单，返回(DataFrame, 编码)；skip_rows为None时使用设置的表头跳过行数
+        :param usecols: 只解析的列（同read_csv/read_excel的usecols），为None时读取全部列
+        """
+        if skip_rows is None:
+            skip_rows = self.skip_rows
+        if file_path.endswith('.csv'):
+            return self.try_read_csv(file_path, skip_rows, is_full_read=True, usecols=usecols)
+        with self.timer.stage(file_path, "解析") as stage:
+            if file_path.endswith(tuple(OUTPUT_FORMATS.values())):
+                df, encoding = read_columnar(file_path, usecols), os.path.splitext(file_path)[1][1:]
+            else:
+                df, encoding = read_excel_sheet(file_path, skip_rows, usecols), "excel"
+            stage.rows = len(df)
+        return df, encoding
+
+    def read_compact(self, file_path, columns, numeric_columns=(), skip_rows=None):
+        """
+        精简读取：只解析需要的列，并压缩列类型后报告节省的内存
+        姓名/学号列重复值多时转为category，numeric_columns中的列在不损失精度时转为float32，其余列保持文本
+        文件中缺少的列不报错，由调用方检查
+        :return: (DataFrame, 编码)
+        """
+        wanted, all_columns = set(columns), []
+
+        def use_column(col):
+            all_columns.append(col)
+            return col in wanted
+
+        df, encoding = self.read_file(file_path, skip_rows, usecols=use_column)
+        text_size = df.memory_usage(deep=True).sum()
+
+        for col in df.columns:
+            series = df[col]
+            if col in numeric_columns:
+                values = pd.to_numeric(series, errors='coerce')
+                compact = values.astype(np.float32)
+                if values.isna().equals(series.isna()) and compact.astype(float).equals(values):
+                    df[col] = compact
+            elif col in (self.name_column, self.id_column) and series.nunique() * 2 < len(series):
+                df[col] = series.astype("category")
+
+        # 整表读取时每列都按文本保存，按已读列的平均占用估算整表内存
+        total_columns = len(dict.fromkeys(all_columns))
+        full_size = text_size / max(len(df.columns), 1) * total_columns
+        compact_size = df.memory_usage(deep=True).sum()
+        self.log(f"文件 {os.path.basename(file_path)}：只读取 {len(df.columns)}/{total_columns} 列，"
+                 f"内存约 {format_bytes(compact_size)}（整表读取约 {format_bytes(full_size)}，"
+                 f"节省约 {1 - compact_size / full_size if full_size else 0:.0%}）")
+        return df, encoding
+
+    @staticmethod
+    def header_full_score(score_column_name):
+        """从总分列名提取满分，提取不到返回None"""
+        # 扩展正则匹配规则
+        patterns = [
+            r'总分\((\d+\.?\d*)\)',  # 总分(80)、总分(80.0)
+            r'总分\((\d+\.?\d*),',  # 总分(80,排名)
+            r'总分[^\d]*(\d+\.?\d*)',  # 总分80、总分_80分
+        ]
+
+        for pattern in patterns:
+            match = re.search(pattern, str(score_column_name))
+            if match:
+                return float(match.group(1))
+        return None
+
+    def known_full_score(self, score_column_name, file_path):
+        """不询问时能确定的满分（顺序同extract_full_score，不输出日志），确定不了返回None"""
+        for key in (file_path, os.path.basename(file_path)):
+            if key in self.full_scores:
+                return float(self.full_scores[key])
+        full_score = self.header_full_score(score_column_name)
+        if full_score is None and self.default_full_score:
+            full_score = float(self.default_full_score)
+        return full_score
+
+    def extract_full_score(self, score_column_name, file_name, file_path=None, ask=True):
+        """
+        确定文件满分：优先使用指定的满分，其次从总分列名提取，再次使用默认满分，最后调用ask_full_score询问
+        :param ask: 为False时不询问，确定不了满分直接返回None
+        """
+        for key in (file_path, file_name):
+            if key in self.full_scores:
+                full_score = float(self.full_scores[key])
+                self.log(f"使用指定的{file_name}满分：{full_score}")
+                return full_score
+
+        full_score = self.header_full_score(score_column_name)
+        if full_score is not None:
+            self.log(f"从列名「{score_column_name}」提取到{file_name}的满分：{full_score}")
+            return full_score
+
+        if self.default_full_score:
+            self.log(f"无法从列名「{score_column_name}」提取{file_name}的满分，使用默认满分：{self.default_full_score}")
+            return float(self.default_full_score)
+
+        # 正则匹配失败，询问调用方（界面弹窗）
+        if not ask:
+            return None
+        if self.ask_full_score is None:
+            raise ValueError(f"无法从列名「{score_column_name}」提取{file_name}的满分，请指定满分")
+        full_score = self.ask_full_score(score_column_name, file_name)
+        if full_score is None:  # 用户取消
+            raise ValueError("用户取消满分输入")
+        return full_score
+
+    @staticmethod
+    def clean_score(score_value):
+        if pd.isna(score_value) or score_value == '' or str(score_value).strip() in SKIPPED_SCORE_TEXTS:
+            return 0.0
+        try:
+            num_str = re.search(r'(\d+\.?\d*)', str(score_value))
+            if num_str:
+                return float(num_str.group(1))
+            else:
+                return 0.0
+        except:
+            return 0.0
+
+    def clean_score_column(self, series):
+        """
+        整列清洗分数，结果与逐个调用clean_score一致：
+        数值直接取值，文本统一用一次str.extract提取数字，缺考/未开考用掩码置0，
+        只有科学计数法、负数、布尔等特殊值才回退到逐行clean_score
+        """
+        result = np.zeros(len(series), dtype=float)
+        fallback = np.zeros(len(series), dtype=bool)
+
+        if pd.api.types.is_numeric_dtype(series) and not pd.api.types.is_bool_dtype(series):
+            is_number = series.notna().to_numpy()
+            is_text = np.zeros(len(series), dtype=bool)
+            numbers = series.to_numpy(dtype=float, na_value=np.nan)
+        else:
+            kinds = series.astype(object).map(type)
+            is_number = kinds.isin([int, float, np.int64, np.float64]).to_numpy()
+            is_text = kinds.eq(str).to_numpy()
+            fallback |= series.notna().to_numpy() & ~is_number & ~is_text
+            numbers = pd.to_numeric(series.where(is_number), errors='coerce').to_numpy(dtype=float, na_value=np.nan)
+
+        # str(数值)为普通小数写法时，正则提取结果就是数值本身；科学计数法/负数/inf交给逐行清洗
+        with np.errstate(invalid='ignore'):
+            plain = (numbers == 0) | ((numbers >= 1e-4) & (numbers < 1e16))
+        result[is_number & plain] = numbers[is_number & plain]
+        fallback |= is_number & ~plain
+
+        if is_text.any():
+            text = series[is_text].astype(str)
+            skipped = text.str.strip().isin(SKIPPED_SCORE_TEXTS).to_numpy()
+            extracted = text.str.extract(r'(\d+\.?\d*)', expand=False)
+            try:
+                values = extracted.astype(float).to_numpy(copy=True)
+            except ValueError:  # 全角数字等float能识别但pandas转换不了的写法
+                values = extracted.map(float, na_action='ignore').to_numpy(dtype=float, na_value=np.nan, copy=True)
+            values[skipped | np.isnan(values)] = 0.0
+            result[is_text] = values
+
+        if fallback.any():
+            result[fallback] = series[fallback].map(self.clean_score).to_numpy(dtype=float)
+        return pd.Series(result, index=series.index)
+
+    def compact_result(self, df):
+        """
+        从处理后的数据中取出汇总所需的精简结果（姓名、学号、统计分，以及数据中已有的各对比规则统计分列），
+        姓名/学号统一转为去空格的文本，缺失时记为未知姓名/未知学号，统计分缺失记为0
+        """
+        for col in [self.name_column, self.id_column]:
+            if col not in df.columns:
+                raise ValueError(f"缺少核心列：{col}")
+
+        def key_text(series, missing):
+            return series.astype(str).str.strip().mask(series.isna(), missing).astype(object)
+
+        result = pd.DataFrame({
+            "姓名": key_text(df[self.name_column], "未知姓名"),
+            "学号": key_text(df[self.id_column], "未知学号"),
+            "统计分": pd.to_numeric(df['统计分'], errors='coerce').fillna(0.0).astype(float),
+        })
+        for col in self.rule_columns():
+            if col in df.columns:
+                result[col] = pd.to_numeric(df[col], errors='coerce').fillna(0.0).astype(float)
+        return result
+
+    def gradebook_rows(self, df):
+        """处理后数据中写入成绩库的列：学号、姓名（同汇总的规则整理）、实际得分、得分率、统计分"""
+        result = self.compact_result(df)
+        return result.assign(实际得分=pd.to_numeric(df['实际得分'], errors='coerce'),
+                             得分率=pd.to_numeric(df['得分率'], errors='coerce'))
+
+    @contextmanager
+    def gradebook_writer(self, save_path, full_score):
+        """
+        成绩库写入：返回add(df)，可逐块写入处理后的数据，文件处理完成时一次提交；未启用成绩库时什么也不做
+        """
+        if not self.db_path:
+            yield lambda df: None
+            return
+        store = GradebookStore(self.db_path)
+        try:
+            with store.replace_file(save_path, full_score) as add:
+                yield lambda df: add(self.gradebook_rows(df))
+        finally:
+            store.close()
+
+    def assign_scores(self, rates):
+        """整列得分率映射为统计分"""
+        return self.segment_table.lookup(rates)
+
+    def worker_settings(self):
+        """传给子进程的纯数据设置（不含回调）"""
+        return {
+            "name_column": self.name_column,
+            "id_column": self.id_column,
+            "score_column": self.score_column,
+            "score_segments": self.score_segments,
+            "rule_sets": self.rule_sets,
+            "skip_rows": self.skip_rows,
+            "chunk_size": self.chunk_size,
+            "compact_output": self.compact_output,
+            "output_format": self.output_format,
+            "db_path": self.db_path,
+            "verbose": self.verbose,
+            "csv_engine": self.csv_engine,
+        }
+
+    def process_file(self, file_path, full_score=None):
+        """
+        处理单个文件：读取、提取满分、计算得分率和统计分、保存为_统计后文件
+        :param full_score: 已确定的满分，为None时从列名提取
+        :return: 处理后文件路径，失败时抛出异常
+        """
+        filename = os.path.basename(file_path)
+        self.log(f"开始处理文件：{filename}（跳过{self.skip_rows}行）")
+        info = self.init_file_info(file_path)
+        info.pop("rule_counts", None)
+        score_column = self.file_score_column(file_path)
+
+        # 提取该文件的满分
+        if full_score is None:
+            with self.timer.stage(file_path, "提取满分"):
+                full_score = self.extract_full_score(score_column, filename, file_path)
+        info["full_score"] = full_score
+        info["stats"] = ScoreStats(len(self.score_segments), full_score)
+        self.log(f"文件 {filename} 的总分满分为：{full_score}")
+
+        if self.chunk_size and file_path.endswith('.csv'):
+            return self.process_csv_in_chunks(file_path, full_score, score_column)
+
+        # 读取文件：精简输出时只读核心列，否则整表读取以保留全部原有列
+        if self.compact_output:
+            df, info["encoding"] = self.read_compact(file_path, self.core_columns(score_column))
+        else:
+            df, info["encoding"] = self.read_file(file_path)
+        self.check_core_columns(df.columns, score_column)
+
+        # 计算得分率+统计分
+        self.add_score_columns(df, full_score, file_path, score_column)
+        info["rows"] = len(df)
+        self.log(f"文件 {filename}：统计分计算完成，共 {len(df)} 条数据")
+
+        # 保存文件
+        save_path = processed_path_for(file_path, self.output_format)
+        with self.timer.stage(file_path, "保存", len(df)):
+            write_table(df, save_path)
+        if self.db_path:
+            with self.timer.stage(file_path, "写入成绩库", len(df)), \
+                    self.gradebook_writer(save_path, full_score) as add_rows:
+                add_rows(df)
+
+        info["processed_path"] = save_path
+        with self.timer.stage(file_path, "精简结果", len(df)):
+            self.results[save_path] = self.compact_result(df)
+        self.log(f"文件 {filename} 已保存为：{os.path.basename(save_path)}")
+        return save_path
+
+    def core_columns(self, score_column=None):
+        """姓名列、学号列、总分列（score_column为该文件使用的总分列，默认为所选总分列）"""
+        return [self.name_column, self.id_column, score_column or self.score_column]
+
+    def check_core_columns(self, columns, score_column=None):
+        for col in self.core_columns(score_column):
+            if col not in columns:
+                raise ValueError(f"缺少核心列：{col}")
+
+    def add_score_columns(self, df, full_score, file_path="", score_column=None):
+        """
+        添加实际得分、得分率、统计分三列；设置了对比规则时每套规则再添加一列统计分_名称，并累计各分数段人次；
+        同一遍计算中把实际得分、得分率、缺考和分数段累加到该文件的分数分布（file_info中的stats）
+        """
+        raw = df[score_column or self.score_column]
+        with self.timer.stage(file_path, "清洗分数", len(df)):
+            df['实际得分'] = self.clean_score_column(raw)
+        info = self.init_file_info(file_path)
+        with self.timer.stage(file_path, "映射统计分", len(df)):
+            df['得分率'] = df['实际得分'] / full_score
+            rates = df['得分率'].to_numpy()
+            if self.rule_table is None:
+                codes = self.segment_table.codes(rates)
+                df['统计分'] = self.segment_table.scores[codes]
+                segment_ids = self.segment_table.segment_of[codes]
+            else:
+                scores, rule_segment_ids = self.rule_table.lookup(rates)
+                df['统计分'] = scores[:, 0]
+                for index, col in enumerate(self.rule_columns(), start=1):
+                    df[col] = scores[:, index]
+                self.add_rule_counts(info, self.rule_table.count(rule_segment_ids))
+                segment_ids = rule_segment_ids[:, 0]
+        stats = info.get("stats")
+        if stats is not None:
+            with self.timer.stage(file_path, "分布统计", len(df)):
+                actual = df['实际得分'].to_numpy()
+                stats.update(actual, rates, self.absent_mask(raw, actual), segment_ids)
+
+    @staticmethod
+    def absent_mask(series, scores):
+        """缺考：总分为空、空白或为缺考/未开考（只检查清洗后为0的行的原始文本）"""
+        absent = series.isna().to_numpy(copy=True)
+        candidates = (scores == 0) & ~absent
+        if candidates.any() and not pd.api.types.is_numeric_dtype(series):
+            text = series[candidates].astype(str).str.strip()
+            absent[candidates] = text.isin(SKIPPED_SCORE_TEXTS + ['']).to_numpy()
+        return absent
+
+    def rule_key(self):
+        """当前规则和对比规则的文本形式，用于判断已记录的分数段人次是否还适用"""
+        return json.dumps([[list(seg) for seg in self.score_segments],
+                           {name: [list(seg) for seg in segments] for name, segments in self.rule_sets.items()}],
+                          ensure_ascii=False)
+
+    def add_rule_counts(self, info, counts):
+        """把一个文件（或分块处理时的一块）各分数段的人次累加到file_info"""
+        key = self.rule_key()
+        recorded = info.get("rule_counts")
+        if recorded is not None and recorded["rules"] == key:
+            counts = recorded["counts"] + counts
+        info["rule_counts"] = {"rules": key, "counts": counts}
+
+    def process_csv_in_chunks(self, file_path, full_score, score_column=None):
+        """
+        分块流式处理CSV：每次只读chunk_size行，计算后追加写入_统计后文件，
+        同时把每块的统计分按学生累加，内存占用与文件大小无关，输出与整表处理逐字节一致
+        """
+        filename = os.path.basename(file_path)
+        info = self.init_file_info(file_path)
+        with self.timer.stage(file_path, "编码检测"):
+            encoding = self.choose_stream_encoding(file_path, info["encoding"])
+        info["encoding"] = encoding
+        self.debug(f"使用编码 {encoding} 分块读取文件（每块 {self.chunk_size} 行）：{filename}")
+
+        save_path = processed_path_for(file_path, self.output_format)
+        rows = 0
+        partial_results = []
+        core_columns = set(self.core_columns(score_column))
+        usecols = (lambda col: col in core_columns) if self.compact_output else None
+        parsed = []
+        # 成绩库写入在处理后文件写完之后才结束，以便记下文件保存完成后的签名
+        with open(file_path, encoding=encoding, newline='') as source, \
+                self.gradebook_writer(save_path, full_score) as add_rows, ChunkedTableWriter(save_path) as target:
+            chunks = self.iter_csv_chunks(source, self.skip_rows, self.chunk_size, usecols, parsed)
+            for chunk_index, chunk in enumerate(self.timed_chunks(file_path, chunks)):
+                if chunk_index == 0:
+                    self.check_core_columns(chunk.columns, score_column)
+                self.add_score_columns(chunk, full_score, file_path, score_column)
+                with self.timer.stage(file_path, "保存", len(chunk)):
+                    target.write(chunk)
+                if self.db_path:
+                    with self.timer.stage(file_path, "写入成绩库", len(chunk)):
+                        add_rows(chunk)
+                with self.timer.stage(file_path, "精简结果", len(chunk)):
+                    partial_results.append(self.aggregate_result(self.compact_result(chunk)))
+                rows += len(chunk)
+
+        info["rows"] = rows
+        info["processed_path"] = save_path
+        self.log_csv_engine(file_path, parsed)
+        self.results[save_path] = self.aggregate_result(pd.concat(partial_results, ignore_index=True))
+        self.log(f"文件 {filename}：统计分计算完成，共 {rows} 条数据")
+        self.log(f"文件 {filename} 已保存为：{os.path.basename(save_path)}")
+        return save_path
+
+    def timed_chunks(self, file_path, chunks):
+        """逐块取出解析结果，每块的解析耗时计入「解析」环节"""
+        iterator = iter(chunks)
+        while True:
+            with self.timer.stage(file_path, "解析") as stage:
+                chunk = next(iterator, None)
+                stage.rows = 0 if chunk is None else len(chunk)
+            if chunk is None:
+                return
+            yield chunk
+
+    @staticmethod
+    def aggregate_result(result):
+        """按学生合并精简结果中的统计分（含各对比规则的统计分，分块处理时每块先合并，内存只与学生数有关）"""
+        score_columns = [col for col in result.columns if col.startswith("统计分")]
+        return result.groupby(["姓名", "学号"], sort=False, as_index=False)[score_columns].sum()
+
+    def start_statistics(self, file_paths, stats_report=True):
+        """
+        批量处理文件，单个文件失败不影响其他文件，失败信息记录在self.errors
+        增量模式下源文件和处理设置都未变化的文件直接沿用已有的_统计后文件
+        :param stats_report: 是否在输出目录保存本批文件的分数分布统计表（监视模式由FolderWatcher按累计的全部文件保存）
+        :return: 处理后文件路径列表（与file_paths顺序一致）
+        """
+        if not all([self.name_column, self.id_column, self.score_column]):
+            raise ValueError("请选择姓名列、学号列、总分列！")
+        if self.segment_table is None:
+            raise ValueError("未设置得分率-分数段规则！")
+        check_output_format(self.output_format)
+        check_csv_engine(self.csv_engine)
+
+        with self.instrumented_run("统计") as run:
+            self.processed_paths = []
+            self.errors = []
+            self.cancelled = False
+            finished = {}
+            pending = []  # [(文件路径, 已确定的满分或None), ...]
+            for file_path in file_paths:
+                if self.incremental:
+                    # 只为查缓存确定满分（不输出日志），需要处理的文件在处理时再提取并记录满分
+                    full_score = self.known_full_score(self.file_score_column(file_path), file_path)
+                    cached_path = self.cached_output(file_path, full_score)
+                    if cached_path:
+                        finished[file_path] = cached_path
+                        continue
+                pending.append((file_path, None))
+            if self.incremental:
+                self.log(f"增量处理：{len(finished)} 个文件未变化已跳过，{len(pending)} 个文件需要处理")
+
+            if self.workers > 1 and len(pending) > 1:
+                self.start_statistics_parallel(pending, finished, len(file_paths))
+            else:
+                rows = 0
+                for index, (file_path, full_score) in enumerate(pending):
+                    if self.check_cancelled(len(pending) - index):
+                        break
+                    try:
+                        finished[file_path] = self.process_file(file_path, full_score)
+                        rows += self.file_info[file_path]["rows"]
+                        self.record_processed(file_path)
+                    except Exception as e:
+                        self.record_error(file_path, str(e), traceback.format_exc())
+                    self.report_progress(len(file_paths) - len(pending) + index + 1, len(file_paths), rows)
+
+            if self.incremental:
+                self.manifest.save()
+            order = {path: i for i, path in enumerate(file_paths)}
+            self.errors.sort(key=lambda item: order[item[0]])
+            self.processed_paths = [finished[path] for path in file_paths if path in finished]
+            self.log("=== 统计分添加任务全部结束 ===")
+            if self.processed_paths or file_paths:
+                run.folder = os.path.dirname((self.processed_paths or file_paths)[0])
+            if self.processed_paths and stats_report:
+                self.write_stats_report([path for path in file_paths if path in finished], run.folder)
+        return self.processed_paths
+
+    def write_stats_report(self, file_paths, folder):
+        """
+        逐文件和整批的分数分布统计表（成绩统计分数分布.csv）：每个文件一行，最后一行为各文件累加器合并后的整批结果，
+        不重新读取任何数据；没有分布统计的文件（如旧版本处理后由增量处理沿用的文件）不计入
+        :return: 统计表路径，没有可统计的文件或保存失败时为None
+        """
+        stats = [(path, self.file_info.get(path, {}).get("stats")) for path in file_paths]
+        missing = [os.path.basename(path) for path, item in stats if item is None]
+        if missing:
+            self.log(f"提示：{'、'.join(missing)} 没有分数分布记录（沿用了旧版本的处理结果），不计入分布统计，"
+                     f"取消增量处理重新统计即可")
+        stats = [(path, item) for path, item in stats if item is not None]
+        if not stats:
+            return None
+
+        rows = [item.report_row(os.path.basename(path), self.score_segments) for path, item in stats]
+        total = ScoreStats.combine([item for _, item in stats], len(self.score_segments))
+        rows.append(total.report_row(f"全部文件（{len(stats)}个）", self.score_segments))
+        report_path = os.path.join(folder, f"{STATS_REPORT_NAME}.csv")
+        try:
+            with self.timer.stage("", "保存分布统计", len(rows)):
+                write_table(pd.DataFrame(rows), report_path)
+        except OSError as e:
+            self.log(f"保存分数分布统计失败：{e}")
+            return None
+        self.log(f"分数分布：共 {total.rows} 人次（缺考 {total.absent}），平均得分率 {rows[-1]['平均得分率']}，"
+                 f"统计表已保存至：{report_path}")
+        return report_path
+
+    def record_error(self, file_path, error, detail):
+        error_msg = f"处理 {os.path.basename(file_path)} 失败：{error}"
+        self.log(error_msg)
+        self.log(f"详细异常堆栈：{detail}")
+        self.errors.append((file_path, error_msg))
+
+    def processing_settings(self, full_score, score_column=None):
+        """影响处理结果的全部设置，任何一项变化都会使增量缓存失效"""
+        segments_text = json.dumps([list(seg) for seg in self.score_segments])
+        settings = {
+            "columns": self.core_columns(score_column),
+            "skip_rows": self.skip_rows,
+            "compact_output": self.compact_output,
+            "output_format": self.output_format,
+            "full_score": full_score,
+            "segments_hash": hashlib.sha1(segments_text.encode('utf-8')).hexdigest(),
+        }
+        if self.rule_sets:  # 没有对比规则时不加这一项，原有的增量缓存仍然有效
+            settings["rule_sets_hash"] = hashlib.sha1(self.rule_key().encode('utf-8')).hexdigest()
+        return settings
+
+    def cached_output(self, file_path, full_score):
+        """
+        增量模式：源文件（大小/修改时间，必要时比对内容哈希）、处理设置和_统计后文件都未变化时返回已有的处理后路径
+        full_score为None表示满分需要人工输入，此时沿用上次记录的满分
+        """
+        entry = self.manifest.get(file_path)
+        if entry is None:
+            return None
+        if full_score is None:
+            full_score = entry["settings"]["full_score"]
+        if entry["settings"] != self.processing_settings(full_score, self.file_score_column(file_path)):
+            return None
+        processed_path = entry["processed_path"]
+        if not os.path.exists(processed_path) or file_signature(processed_path) != entry["output"]:
+            return None
+        source = file_signature(file_path)
+        if source != entry["source"]:
+            # 大小不变、只有修改时间变化（如重新复制）时再比对内容哈希
+            if source["size"] != entry["source"]["size"] or file_sha1(file_path) != entry["sha1"]:
+                return None
+            entry["source"] = source
+            self.manifest.put(file_path, entry)
+
+        info = self.init_file_info(file_path)
+        info.update(encoding=entry["encoding"], full_score=full_score, processed_path=processed_path,
+                    rows=entry["rows"])
+        info.pop("stats", None)
+        if entry.get("stats"):
+            info["stats"] = ScoreStats.from_dict(entry["stats"])
+        self.log(f"文件 {os.path.basename(file_path)} 未变化，沿用已有的 {os.path.basename(processed_path)}")
+        return processed_path
+
+    def record_processed(self, file_path):
+        """处理成功后把源文件、设置和输出文件的指纹写入增量清单"""
+        if not self.incremental:
+            return
+        info = self.file_info[file_path]
+        self.manifest.put(file_path, {
+            "source": file_signature(file_path),
+            "sha1": file_sha1(file_path),
+            "settings": self.processing_settings(info["full_score"], self.file_score_column(file_path)),
+            "processed_path": info["processed_path"],
+            "output": file_signature(info["processed_path"]),
+            "encoding": info["encoding"],
+            "rows": info["rows"],
+            "stats": info["stats"].to_dict() if "stats" in info else None,
+        })
+
+    def start_statistics_parallel(self, pending, finished, total):
+        """
+        用进程池并行处理文件：满分在主进程确定（可能需要询问），子进程只拿纯数据；
+        每个文件完成后立即输出其日志并更新file_info，结果写入finished，由调用方按输入顺序整理
+        """
+        self.log(f"使用 {self.workers} 个进程并行处理 {len(pending)} 个文件")
+        settings = self.worker_settings()
+        done_before = total - len(pending)
+        rows = 0
+        with ProcessPoolExecutor(max_workers=self.workers) as executor:
+            futures = {}
+            for index, (file_path, full_score) in enumerate(pending):
+                if self.check_cancelled(len(pending) - index):
+                    break
+                try:
+                    if full_score is None:
+                        full_score = self.extract_full_score(self.file_score_column(file_path),
+                                                             os.path.basename(file_path), file_path)
+                except Exception as e:
+                    self.record_error(file_path, str(e), traceback.format_exc())
+                    continue
+                encoding = self.init_file_info(file_path)["encoding"]
+                futures[executor.submit(process_file_worker, file_path, settings, full_score, encoding,
+                                        self.file_score_column(file_path))] = file_path
+
+            for done, future in enumerate(as_completed(futures), start=1):
+                file_path = futures[future]
+                if self.check_cancelled(len(futures) - done + 1):
+                    # 尚未开始的文件直接取消，已在运行的文件处理完再结束
+                    for waiting in futures:
+                        waiting.cancel()
+                if future.cancelled():
+                    continue
+                try:
+                    outcome = future.result()
+                except Exception as e:  # 子进程异常退出等
+                    outcome = {"logs": [], "error": str(e), "traceback": traceback.format_exc()}
+                for line in outcome["logs"]:
+                    self.log(line)
+                self.timer.merge(outcome.get("timings", {}))
+                if "error" in outcome:
+                    self.record_error(file_path, outcome["error"], outcome["traceback"])
+                else:
+                    self.init_file_info(file_path).update(outcome["file_info"])
+                    finished[file_path] = outcome["processed_path"]
+                    self.results[outcome["processed_path"]] = outcome["result"]
+                    rows += outcome["file_info"]["rows"]
+                    self.record_processed(file_path)
+                self.report_progress(done_before + done, total, rows)
+
+    def summary_result(self, processed_path):
+        """汇总用的精简结果：优先使用本次统计的内存结果，没有时（如重启后直接汇总）才从处理后文件读取"""
+        filename = os.path.basename(processed_path)
+        result = self.results.get(processed_path)
+        if result is not None:
+            self.log(f"汇总文件：{filename}（使用本次统计的内存结果）")
+            return result
+        self.log(f"汇总文件：{filename}（从文件读取）")
+        score_columns = ['统计分', *self.rule_columns()]
+        df, _ = self.read_compact(processed_path, [self.name_column, self.id_column, *score_columns],
+                                  numeric_columns=score_columns, skip_rows=0)
+        if '统计分' not in df.columns:
+            raise ValueError("文件中无「统计分」列，请先执行「开始统计」！")
+        result = self.compact_result(df)
+        self.results[processed_path] = result
+        return result
+
+    def ensure_stored(self, store, processed_path):
+        """
+        成绩库模式汇总前确认文件已在库中（如增量处理沿用的文件、启用成绩库之前处理的文件），
+        不在库中或库中记录与现在的处理后文件不一致（文件在未启用成绩库时被重新生成）时，
+        从处理后文件读取并重新写入，返回该文件的记录数
+        """
+        filename = os.path.basename(processed_path)
+        count = store.file_rows(processed_path)
+        if count and store.is_current(processed_path):
+            self.log(f"汇总文件：{filename}（使用成绩库）")
+            return count
+        if count:
+            self.log(f"汇总文件：{filename}（成绩库中的记录与文件不一致，从文件重新读取并写入成绩库）")
+        else:
+            self.log(f"汇总文件：{filename}（从文件读取并写入成绩库）")
+        score_columns = ['实际得分', '得分率', '统计分']
+        df, _ = self.read_compact(processed_path, [self.name_column, self.id_column, *score_columns],
+                                  numeric_columns=score_columns, skip_rows=0)
+        for col in score_columns:
+            if col not in df.columns:
+                raise ValueError(f"文件中无「{col}」列，请先执行「开始统计」！")
+        full_score = next((info["full_score"] for info in self.file_info.values()
+                           if info["processed_path"] == processed_path), None)
+        with store.replace_file(processed_path, full_score) as add:
+            add(self.gradebook_rows(df))
+        return len(df)
+
+    def summary_total_score(self, processed_paths=None, summary_dir=None):
+        """
+        汇总所有处理后文件的统计分总分，保存为成绩统计总分汇总.csv；
+        设置了对比规则时并列输出各套规则的统计分总分_名称，另存各分数段人次的规则对比表
+        :return: (汇总DataFrame, 汇总文件路径, 参与汇总的文件数)，无有效数据时抛出ValueError
+        """
+        if processed_paths is None:
+            processed_paths = self.processed_paths
+        if not processed_paths:
+            raise ValueError("请先执行「开始统计」生成处理后的文件！")
+        if not all([self.name_column, self.id_column]):
+            raise ValueError("请选择姓名列、学号列！")
+        check_output_format(self.output_format)
+        check_csv_engine(self.csv_engine)
+
+        with self.instrumented_run("汇总") as run:
+            file_results = []  # 每个文件的精简结果；成绩库模式下为已入库的处理后文件路径
+            summarized = []  # 成功读取的处理后文件
+            rows = 0
+            self.errors = []
+            self.cancelled = False
+            store = GradebookStore(self.db_path) if self.db_path else None
+
+            try:
+                for index, processed_path in enumerate(processed_paths):
+                    if self.check_cancelled(len(processed_paths) - index):
+                        break
+                    filename = os.path.basename(processed_path)
+                    try:
+                        with self.timer.stage(processed_path, "汇总读取") as stage:
+                            if store is not None:
+                                count = self.ensure_stored(store, processed_path)
+                                file_results.append(processed_path)
+                            else:
+                                result = self.summary_result(processed_path)
+                                count = len(result)
+                                file_results.append(result.assign(文件序号=index))
+                            stage.rows = count
+                        rows += count
+                        summarized.append(processed_path)
+                        self.log(f"汇总 {filename}：{count} 条数据")
+
+                    except Exception as e:
+                        error_msg = f"汇总 {filename} 失败：{str(e)}"
+                        self.log(error_msg)
+                        self.log(f"详细异常堆栈：{traceback.format_exc()}")
+                        self.errors.append((processed_path, error_msg))
+                    self.report_progress(index + 1, len(processed_paths), rows)
+
+                if self.cancelled:
+                    raise ValueError("汇总任务已取消，未生成汇总文件！")
+                if not file_results or not rows:
+                    raise ValueError("无有效数据可汇总！")
+
+                with self.timer.stage("", "汇总聚合", rows):
+                    if store is not None:
+                        # 成绩库模式：一条SQL按学生聚合
+                        summary_df = store.summary(file_results)
+                        if self.rule_sets:
+                            self.log("提示：成绩库模式的汇总只含当前规则的统计分总分，对比规则只输出规则对比表")
+                    else:
+                        # 一次concat+groupby：参与文件数为每名学生实际出现的文件数，各对比规则的总分并列在后
+                        rule_columns = [col for col in self.rule_columns()
+                                        if all(col in result.columns for result in file_results)]
+                        if len(rule_columns) < len(self.rule_sets):
+                            self.log("提示：部分处理后文件中没有对比规则的统计分列（处理时未设置该规则），"
+                                     "汇总不含这些规则的总分，请重新执行「开始统计」")
+                        summary_df = (
+                            pd.concat(file_results, ignore_index=True)
+                            .groupby(["姓名", "学号"], sort=False)
+                            .agg(参与文件数=("文件序号", "nunique"), 统计分总分=("统计分", "sum"),
+                                 **{col.replace("统计分", "统计分总分", 1): (col, "sum") for col in rule_columns})
+                            .reset_index()
+                        )
+                    for col in summary_df.columns:
+                        if col.startswith("统计分总分"):
+                            summary_df[col] = summary_df[col].round(2)
+                    summary_df = summary_df.sort_values("统计分总分", ascending=False, kind="stable").reset_index(drop=True)
+            finally:
+                if store is not None:
+                    store.close()
+
+            file_count = len(file_results)
+            if summary_dir is None:
+                summary_dir = os.path.dirname(processed_paths[0])
+            summary_path = summary_path_for(summary_dir, self.output_format)
+            run.folder = summary_dir
+            with self.timer.stage("", "保存汇总", len(summary_df)):
+                write_table(summary_df, summary_path)
+            if self.rule_table is not None:
+                self.write_rule_report(summarized, summary_dir, summary_df)
+
+            self.log(f"汇总完成！共 {len(summary_df)} 名学生，汇总文件已保存至：{summary_path}")
+        return summary_df, summary_path, file_count
+
+    def rule_counts(self, processed_path):
+        """
+        某个处理后文件在当前规则和各对比规则下每个分数段的人次：优先用处理时累计的人次，
+        没有时（如增量处理沿用的文件、重启后直接汇总）只读取处理后文件的得分率列重新计数
+        """
+        info = next((info for info in self.file_info.values() if info["processed_path"] == processed_path), {})
+        recorded = info.get("rule_counts")
+        if recorded is not None and recorded["rules"] == self.rule_key():
+            return recorded["counts"]
+        df, _ = self.read_compact(processed_path, ['得分率'], numeric_columns=['得分率'], skip_rows=0)
+        if '得分率' not in df.columns:
+            raise ValueError("文件中无「得分率」列，请先执行「开始统计」！")
+        counts = self.rule_table.count(self.rule_table.lookup(df['得分率'].to_numpy())[1])
+        self.add_rule_counts(info, counts)
+        return counts
+
+    def write_rule_report(self, processed_paths, summary_dir, summary_df):
+        """
+        规则对比表：当前规则和各对比规则每个分数段的人次和占比（每个文件的每一行计一次），
+        保存为成绩统计规则对比.csv，并在日志中并列输出各套规则的平均统计分总分
+        """
+        counts = np.zeros(self.rule_table.offsets[-1], dtype=np.int64)
+        for processed_path in processed_paths:
+            try:
+                with self.timer.stage(processed_path, "规则对比计数"):
+                    counts += self.rule_counts(processed_path)
+            except Exception as e:
+                self.log(f"规则对比 {os.path.basename(processed_path)} 失败，不计入人次：{e}")
+
+        names = [CURRENT_RULE_NAME, *self.rule_sets]
+        rows = []
+        for name, table, rule_counts in zip(names, self.rule_table.tables, self.rule_table.split_counts(counts)):
+            total = rule_counts.sum()
+            labels = [(str(index + 1), f"[{min_rate:g}, {max_rate:g}]", score)
+                      for index, (min_rate, max_rate, score) in enumerate(table.segments)]
+            labels += [("未覆盖", "、".join(table.gaps), 0.0), ("无得分率", "", None)]
+            for (segment, rate_range, score), count in zip(labels, rule_counts):
+                if count or segment.isdigit():  # 未覆盖/无得分率只在有人次时列出
+                    rows.append({"规则": name, "分数段": segment, "得分率范围": rate_range, "分值": score,
+                                 "人次": int(count), "占比": round(count / total, 4) if total else 0.0})
+            total_column = "统计分总分" if name == CURRENT_RULE_NAME else f"统计分总分_{name}"
+            if total_column in summary_df.columns:
+                per_segment = '/'.join(str(count) for count in rule_counts[:len(table.segments)])
+                self.log(f"规则「{name}」：平均统计分总分 {summary_df[total_column].mean():.2f}，"
+                         f"各分数段人次 {per_segment}")
+
+        report_path = os.path.join(summary_dir, f"{RULE_REPORT_NAME}.csv")
+        with self.timer.stage("", "保存规则对比", len(rows)):
+            write_table(pd.DataFrame(rows), report_path)
+        self.log(f"规则对比表已保存至：{report_path}")
+
+    def wide_result(self, processed_path, values):
+        """成绩册中一个作业的数据：姓名、学号和values中的各列；只需要统计分时与汇总共用精简结果"""
+        if list(values) == ['统计分']:
+            return self.summary_result(processed_path)
+        df, _ = self.read_compact(processed_path, [self.name_column, self.id_column, *values],
+                                  numeric_columns=values, skip_rows=0)
+        for col in values:
+            if col not in df.columns:
+                raise ValueError(f"文件中无「{col}」列，请先执行「开始统计」！")
+        result = self.compact_result(df)
+        for col in values:
+            if col != '统计分':
+                result[col] = pd.to_numeric(df[col], errors='coerce').astype(float)
+        return result[["姓名", "学号", *values]]
+
+    def export_wide_table(self, processed_paths=None, summary_dir=None, values=('统计分',), file_format=""):
+        """
+        导出成绩册宽表：每名学生一行，每个处理后文件（作业）一列，输出多个值时列名为「作业_值」，
+        最后是统计分总分和提交作业数（学生实际出现的作业数）；学生没有出现的作业保持为空（NaN），不按0计
+        所有作业的数据一次concat，学生键转为category后用一次groupby+unstack展开，不逐个单元格填写
+        :param values: 每个作业输出的值，WIDE_TABLE_VALUES中的一个或多个（总是包含统计分）
+        :param file_format: WIDE_TABLE_FORMATS中的一种，为空时与汇总文件相同（parquet/feather或csv）
+        :return: (成绩册DataFrame, 保存路径)，无有效数据时抛出ValueError
+        """
+        if processed_paths is None:
+            processed_paths = self.processed_paths
+        if not processed_paths:
+            raise ValueError("请先执行「开始统计」生成处理后的文件！")
+        if not all([self.name_column, self.id_column]):
+            raise ValueError("请选择姓名列、学号列！")
+        values = ['统计分'] + [col for col in WIDE_TABLE_VALUES if col in values and col != '统计分']
+        file_format = file_format or self.output_format or "csv"
+        if file_format not in WIDE_TABLE_FORMATS:
+            raise ValueError(f"不支持的成绩册格式：{file_format}（可选：{'、'.join(WIDE_TABLE_FORMATS)}）")
+        check_output_format(file_format if file_format in OUTPUT_FORMATS else "")
+        check_csv_engine(self.csv_engine)
+
+        with self.instrumented_run("成绩册") as run:
+            self.errors = []
+            frames, labels = [], []
+            for processed_path in processed_paths:
+                try:
+                    with self.timer.stage(processed_path, "成绩册读取") as stage:
+                        result = self.wide_result(processed_path, values)
+                        stage.rows = len(result)
+                except Exception as e:
+                    error_msg = f"成绩册读取 {os.path.basename(processed_path)} 失败：{str(e)}"
+                    self.log(error_msg)
+                    self.log(f"详细异常堆栈：{traceback.format_exc()}")
+                    self.errors.append((processed_path, error_msg))
+                    continue
+                label = assignment_name(processed_path)
+                while label in labels:  # 不同文件夹中的同名作业
+                    label += "'"
+                frames.append(result.assign(作业=len(labels)))
+                labels.append(label)
+            if not frames:
+                raise ValueError("无有效数据可导出！")
+
+            rows = sum(len(frame) for frame in frames)
+            with self.timer.stage("", "成绩册构建", rows):
+                long = pd.concat(frames, ignore_index=True)
+                long["作业"] = pd.Categorical.from_codes(long["作业"], categories=labels)
+                for col in ("姓名", "学号"):
+                    long[col] = pd.Categorical(long[col], categories=pd.unique(long[col]))
+                # 同一作业中重复出现的学生（分块处理时已合并）按汇总的规则相加，全部为空时保持为空
+                table = (long.groupby(["姓名", "学号", "作业"], observed=True)[values].sum(min_count=1)
+                         .unstack("作业"))
+                students = pd.MultiIndex.from_frame(long[["姓名", "学号"]].drop_duplicates())
+                table = table.reindex(students)  # 学生按首次出现的顺序，与汇总文件一致
+                scores = table['统计分'].reindex(columns=labels)
+                table = table.swaplevel(axis=1).reindex(columns=pd.MultiIndex.from_product([labels, values]))
+                table.columns = [label if len(values) == 1 else f"{label}_{value}" for label, value in table.columns]
+                table["统计分总分"] = scores.sum(axis=1).round(2)
+                table["提交作业数"] = scores.notna().sum(axis=1)
+                wide_df = (table.reset_index().astype({"姓名": object, "学号": object})
+                           .sort_values("统计分总分", ascending=False, kind="stable").reset_index(drop=True))
+
+            if summary_dir is None:
+                summary_dir = os.path.dirname(processed_paths[0])
+            wide_path = wide_table_path_for(summary_dir, file_format)
+            run.folder = summary_dir
+            with self.timer.stage("", "保存成绩册", len(wide_df)):
+                write_table(wide_df, wide_path)
+            self.log(f"成绩册导出完成！共 {len(wide_df)} 名学生 × {len(labels)} 个作业，已保存至：{wide_path}")
+        return wide_df, wide_path
+
+
+class FolderWatcher:
+    """
+    监视文件夹：定时用os.scandir递归扫描，新增或修改的成绩文件在大小和修改时间保持settle秒不变后
+    交给引擎的start_statistics处理，再用内存中各文件的结果重新汇总（已处理的文件不会重新读取），删除的文件从汇总中去掉
+    引擎（编译好的分数段规则、列选择、各文件结果）在整个监视期间一直保留，不依赖图形界面
+    """
+
+    def __init__(self, engine, folder, interval=5.0, settle=2.0, summary=True, summary_dir=None):
+        """
+        :param engine: 已设置分数段规则的ScoreEngine；未指定的列在第一批文件到达时按列名自动匹配
+        :param interval: 两次扫描之间的秒数
+        :param settle: 文件大小和修改时间保持不变多少秒后才处理（避免读取复制/导出到一半的文件）
+        :param summary: 每批文件处理完后更新汇总文件
+        :param summary_dir: 汇总文件保存目录，默认为监视的文件夹
+        """
+        self.engine = engine
+        self.folder = folder
+        self.interval = interval
+        self.settle = settle
+        self.summary = summary
+        self.summary_dir = summary_dir or folder
+        self.observed = {}  # 等待稳定的文件：{路径: ((大小, 修改时间), 首次看到该状态的时间)}
+        self.handled = {}  # 已处理（含处理失败）的文件：{路径: (大小, 修改时间)}
+        self.outputs = {}  # 处理成功的文件：{原路径: 处理后路径}
+
+    def ready_files(self, snapshot, now):
+        """本次扫描中已经稳定、需要处理的文件（新文件或处理后又被修改的文件）"""
+        ready = []
+        for path, signature in snapshot.items():
+            if self.handled.get(path) == signature:
+                continue
+            seen = self.observed.get(path)
+            if seen is None or seen[0] != signature:
+                self.observed[path] = (signature, now)  # 新出现或仍在写入，从现在开始计时
+            elif now - seen[1] >= self.settle:
+                ready.append(path)
+        return sorted(ready)
+
+    def poll(self):
+        """
+        扫描一次文件夹：处理已稳定的新文件/修改过的文件，文件有增删改时更新分布统计和汇总
+        :return: 本次处理的文件数
+        """
+        snapshot = scan_score_files(self.folder)
+        removed = [path for path in self.handled if path not in snapshot]
+        for path in removed:
+            del self.handled[path]
+            processed_path = self.outputs.pop(path, None)
+            if processed_path:
+                self.engine.results.pop(processed_path, None)
+        for path in [path for path in self.observed if path not in snapshot]:
+            del self.observed[path]
+        if removed:
+            self.engine.log(f"文件已删除，从汇总中去掉：{[os.path.basename(path) for path in removed]}")
+
+        ready = self.ready_files(snapshot, time.monotonic())
+        if ready:
+            self.process(ready, snapshot)
+        # 分布统计覆盖监视期间处理过、现在仍存在的全部文件（合并内存中各文件的累加器，不重新读取）
+        if self.outputs and (ready or removed):
+            self.engine.write_stats_report(sorted(self.outputs), self.summary_dir)
+        if self.summary and (ready or removed):
+            self.update_summary()
+        return len(ready)
+
+    def process(self, file_paths, snapshot):
+        """用引擎处理一批文件，记录每个文件处理时的大小/修改时间，之后再变化才会重新处理"""
+        engine = self.engine
+        engine.log(f"发现 {len(file_paths)} 个新的或修改过的文件：{[os.path.basename(path) for path in file_paths]}")
+        try:
+            if not all(engine.core_columns()):
+                columns, _ = engine.read_columns(file_paths[0])
+                matched = match_columns(columns)
+                engine.name_column, engine.id_column, engine.score_column = (
+                    current or auto for current, auto in zip(engine.core_columns(), matched))
+                engine.log(f"使用列名：姓名列={engine.name_column}, 学号列={engine.id_column}, "
+                           f"总分列={engine.score_column}")
+            engine.scan_files(file_paths)
+            engine.start_statistics(file_paths, stats_report=False)
+            failed = {path for path, _ in engine.errors}
+        except ValueError as e:
+            engine.log(f"处理失败：{e}")
+            failed = set(file_paths)
+
+        for path in file_paths:
+            self.handled[path] = snapshot[path]
+            self.observed.pop(path, None)
+            if path in failed:
+                self.outputs.pop(path, None)
+            else:
+                self.outputs[path] = engine.file_info[path]["processed_path"]
+
+    def update_summary(self):
+        """用各文件的内存结果重新汇总（按原文件路径排序，结果与对整个文件夹汇总一次相同）"""
+        try:
+            self.engine.summary_total_score([self.outputs[path] for path in sorted(self.outputs)],
+                                            summary_dir=self.summary_dir)
+        except ValueError as e:
+            self.engine.log(f"汇总未更新：{e}")
+
+    def run(self, stop_event=None):
+        """持续监视，直到stop_event（threading.Event）置位；命令行中按Ctrl+C结束"""
+        self.engine.log(f"开始监视文件夹：{self.folder}（每 {self.interval:g} 秒扫描一次，"
+                        f"文件保持 {self.settle:g} 秒不变后处理，按Ctrl+C结束）")
+        while True:
+            self.poll()
+            if stop_event is None:
+                time.sleep(self.interval)
+            elif stop_event.wait(self.interval):
+                return
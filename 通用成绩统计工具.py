@@ -1,13 +1,27 @@
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
-import pandas as pd
+import importlib
+import multiprocessing
 import os
-from collections import defaultdict
-import chardet
-import re
+import queue
+import threading
+import time
+from collections import deque
 from datetime import datetime
 import traceback  # 用于打印详细异常信息
 
+SAME_FORMAT = "与原文件相同"  # 输出格式下拉框的默认项
+LOG_MAX_LINES = 2000  # 日志框最多保留的行数，更早的日志只保存在日志文件中
+LOG_FILE_NAME = "成绩统计日志.log"  # 完整日志文件（保存在用户主目录，按大小轮转）
+
+
+def load_engine():
+    """
+    导入统计引擎模块score_engine（会导入pandas/numpy，耗时较长，因此不在启动时导入）
+    窗口显示后由后台线程预先导入；用户操作时若后台还没导入完，import会等待其完成，不会重复导入
+    """
+    return importlib.import_module("score_engine")
+
 
 class ScoreStatisticsApp:
     def __init__(self, root):
@@ -19,15 +33,42 @@ class ScoreStatisticsApp:
         self.file_paths = []  # 选中的文件路径（原文件）
         self.processed_paths = []  # 处理后的文件路径（带_统计后后缀）
         self.file_info = {}  # 存储文件信息：{原路径: {columns: [], encoding: '', processed_path: '', full_score: ''}}
+        self.scanned_paths = set()  # 已扫描过表头的文件（无论是否读到列名），开始统计前不再重复扫描
+        self.file_results = {}  # 本次统计的精简结果：{处理后路径: DataFrame(姓名, 学号, 统计分)}，汇总时直接使用
+        self.full_scores = {}  # 在「文件表头检查」中填写的满分：{原路径: 满分}
         self.score_segments = []  # 分数段规则：[(min_rate, max_rate, score), ...]（改为得分率）
+        self.rule_sets = {}  # 对比规则：{名称: 分数段规则}，每套规则另外输出一列统计分_名称
         self.segment_count = tk.IntVar(value=0)  # 分数段数量
         self.skip_header = tk.IntVar(value=0)  # 表头跳过行数（你的文件填0）
         self.score_column_var = tk.StringVar()  # 选中的总分列
         self.name_column_var = tk.StringVar()  # 选中的姓名列
         self.id_column_var = tk.StringVar()  # 选中的学号列
+        self.worker_count = tk.IntVar(value=1)  # 并行处理进程数（1为逐个处理）
+        self.incremental_var = tk.BooleanVar(value=False)  # 增量处理：跳过未变化的文件
+        self.chunk_size = tk.IntVar(value=0)  # CSV分块流式处理的行数（0为整表读取）
+        self.compact_output_var = tk.BooleanVar(value=False)  # 精简输出：只读取并保存核心列
+        self.output_format_var = tk.StringVar(value=SAME_FORMAT)  # 处理后文件/汇总文件的保存格式
+        self.csv_engine_var = tk.StringVar(value="auto")  # CSV解析引擎：auto有pyarrow时多线程解析，否则用pandas
+        self.gradebook_var = tk.BooleanVar(value=False)  # 结果写入成绩库（与成绩文件同目录的SQLite文件）
+        self.timing_report_var = tk.BooleanVar(value=False)  # 在输出目录写出耗时报告
+        self.verbose_log_var = tk.BooleanVar(value=False)  # 详细日志：显示每个文件的编码检测等细节
+        self.wide_raw_var = tk.BooleanVar(value=False)  # 成绩册中同时输出每个作业的实际得分和得分率
+
+        # 日志：任意线程先放入缓冲区，主线程定时批量插入日志框；同时写入日志文件（统计引擎加载后打开）
+        self.log_lines = deque(maxlen=LOG_MAX_LINES)
+        self.file_log = None  # 日志文件，尚未打开时为None，无法打开时为False
+        self.file_log_backlog = []  # 日志文件打开前的日志
+
+        # 后台任务：批处理在工作线程中运行，进度/弹窗请求经ui_queue交给主线程处理（日志见log）
+        self.ui_queue = queue.Queue()
+        self.cancel_event = threading.Event()
+        self.task_thread = None
+        self.task_start_time = 0.0
 
         # 创建UI界面
         self.create_widgets()
+        self.root.after(100, self.poll_ui_queue)
+        self.root.after(100, self.preload_engine)
 
     def create_widgets(self):
         # 1. 文件上传区域
@@ -62,6 +103,16 @@ class ScoreStatisticsApp:
                                            width=15)
         self.score_combobox.grid(row=2, column=1, padx=2, pady=2)
 
+        ttk.Label(frame_columns, text="输出格式：").grid(row=3, column=0, padx=2, pady=2)
+        self.output_format_combobox = ttk.Combobox(frame_columns, textvariable=self.output_format_var,
+                                                   state="readonly", width=15, values=[SAME_FORMAT])
+        self.output_format_combobox.grid(row=3, column=1, padx=2, pady=2)  # 其余选项在统计引擎加载后补全
+
+        ttk.Label(frame_columns, text="CSV解析：").grid(row=4, column=0, padx=2, pady=2)
+        self.csv_engine_combobox = ttk.Combobox(frame_columns, textvariable=self.csv_engine_var,
+                                                state="readonly", width=15, values=["auto"])
+        self.csv_engine_combobox.grid(row=4, column=1, padx=2, pady=2)
+
         # 2. 分数段设置区域（改为得分率）
         frame_segment = ttk.LabelFrame(self.root, text="2. 得分率-分数段规则设置（适配不同满分）")
         frame_segment.pack(fill="x", padx=10, pady=5)
@@ -79,15 +130,48 @@ class ScoreStatisticsApp:
         self.segment_frame = ttk.Frame(frame_segment)
         self.segment_frame.grid(row=2, column=0, columnspan=3, padx=5, pady=5)
 
+        # 对比规则：每行一套，统计时与上面的规则一起计算（每个文件只读取一次）
+        ttk.Label(frame_segment, text="对比规则（可选，每行：名称=0,0.59,1;0.6,1.0,2）").grid(
+            row=3, column=0, columnspan=3, padx=5, pady=2, sticky="w")
+        self.rule_set_text = tk.Text(frame_segment, height=3, width=60, font=("Arial", 10))
+        self.rule_set_text.grid(row=4, column=0, columnspan=3, padx=5, pady=2, sticky="w")
+
         # 3. 操作按钮区域
         frame_operate = ttk.Frame(self.root)
         frame_operate.pack(fill="x", padx=10, pady=10)
 
-        ttk.Button(frame_operate, text="开始统计（添加统计分）", command=self.start_statistics).pack(side="left", padx=10)
-        ttk.Button(frame_operate, text="汇总所有文件总分", command=self.summary_total_score).pack(side="left", padx=10)
+        self.start_button = ttk.Button(frame_operate, text="开始统计（添加统计分）", command=self.start_statistics)
+        self.start_button.pack(side="left", padx=10)
+        self.summary_button = ttk.Button(frame_operate, text="汇总所有文件总分", command=self.summary_total_score)
+        self.summary_button.pack(side="left", padx=10)
+        self.wide_table_button = ttk.Button(frame_operate, text="导出成绩册", command=self.export_wide_table)
+        self.wide_table_button.pack(side="left", padx=10)
         ttk.Button(frame_operate, text="清空日志", command=self.clear_log).pack(side="left", padx=10)
         # 在操作按钮区域新增重置按钮
         ttk.Button(frame_operate, text="重置所有配置", command=self.reset_all).pack(side="left", padx=10)
+        ttk.Label(frame_operate, text="并行进程数：").pack(side="left", padx=(20, 0))
+        ttk.Entry(frame_operate, textvariable=self.worker_count, width=5).pack(side="left")
+        ttk.Label(frame_operate, text="CSV分块行数：").pack(side="left", padx=(10, 0))
+        ttk.Entry(frame_operate, textvariable=self.chunk_size, width=8).pack(side="left")
+        ttk.Checkbutton(frame_operate, text="增量处理（跳过未变化的文件）", variable=self.incremental_var).pack(
+            side="left", padx=10)
+        ttk.Checkbutton(frame_operate, text="精简输出（只保留姓名/学号/总分列）", variable=self.compact_output_var).pack(
+            side="left")
+        ttk.Checkbutton(frame_operate, text="写入成绩库", variable=self.gradebook_var).pack(side="left", padx=10)
+        ttk.Checkbutton(frame_operate, text="耗时报告", variable=self.timing_report_var).pack(side="left")
+        ttk.Checkbutton(frame_operate, text="详细日志", variable=self.verbose_log_var).pack(side="left", padx=10)
+        ttk.Checkbutton(frame_operate, text="成绩册含实际得分/得分率", variable=self.wide_raw_var).pack(side="left")
+
+        # 进度显示区域
+        frame_progress = ttk.Frame(self.root)
+        frame_progress.pack(fill="x", padx=10, pady=(0, 5))
+
+        self.progress_bar = ttk.Progressbar(frame_progress, mode="determinate", length=400)
+        self.progress_bar.pack(side="left", padx=10)
+        self.progress_label = ttk.Label(frame_progress, text="空闲")
+        self.progress_label.pack(side="left", padx=10)
+        self.cancel_button = ttk.Button(frame_progress, text="取消", command=self.cancel_task, state="disabled")
+        self.cancel_button.pack(side="left", padx=10)
 
         # 4. 日志显示区域
         frame_log = ttk.LabelFrame(self.root, text="3. 运行日志")
@@ -107,6 +191,38 @@ class ScoreStatisticsApp:
         self.log("提示：1. 选择文件 2. 确认列名 3. 配置得分率-分数段 4. 开始统计 5. 汇总总分")
         self.log("注意：分数段需填写「得分率范围」（例：0,0.59,1；0.6,1.0,2）")
 
+    def preload_engine(self):
+        """窗口显示后在后台线程导入统计引擎，导入完成后在主线程补全依赖引擎的界面选项"""
+        def worker():
+            start = time.perf_counter()
+            try:
+                engine = load_engine()
+            except Exception as e:
+                self.file_log = False
+                self.log(f"加载统计引擎失败（请确认已安装pandas等依赖）：{e}")
+                return
+            self.call_in_main_thread(self.on_engine_loaded, engine, time.perf_counter() - start)
+
+        threading.Thread(target=worker, daemon=True).start()
+
+    def on_engine_loaded(self, engine, elapsed):
+        self.output_format_combobox['values'] = [SAME_FORMAT, *engine.OUTPUT_FORMATS]
+        self.csv_engine_combobox['values'] = list(engine.CSV_ENGINES)
+        self.log(f"统计引擎加载完成（{elapsed:.2f}秒）")
+
+        log_path = os.path.join(os.path.expanduser("~"), LOG_FILE_NAME)
+        try:
+            file_log = engine.open_log_file(log_path, "通用成绩统计工具")
+        except OSError as e:
+            self.file_log = False
+            self.log(f"无法打开日志文件，完整日志不会保存：{e}")
+        else:
+            for msg in self.file_log_backlog:
+                file_log.info(msg)
+            self.file_log = file_log
+            self.log(f"完整日志保存在：{log_path}")
+        self.file_log_backlog = []
+
     def custom_ask_float(self, title, prompt):
         """
         自定义浮点数输入弹窗（替代askfloat/askstring，兼容低版本Tkinter）
@@ -161,36 +277,90 @@ class ScoreStatisticsApp:
         self.root.wait_window(top)
         return result
 
-    def detect_encoding(self, file_path):
-        with open(file_path, 'rb') as f:
-            raw_data = f.read(4096)
-        result = chardet.detect(raw_data)
-        return result['encoding']
-
-    def try_read_csv(self, file_path, skip_rows, is_full_read=False):
+    def call_in_main_thread(self, func, *args):
+        """在工作线程中调用需要Tk的函数（如弹窗），阻塞等待主线程执行完成并返回结果"""
+        if threading.current_thread() is threading.main_thread():
+            return func(*args)
+        reply = queue.Queue(maxsize=1)
+        self.ui_queue.put(("call", func, args, reply))
+        ok, value = reply.get()
+        if not ok:
+            raise value
+        return value
+
+    def poll_ui_queue(self):
+        """主线程定时处理工作线程发来的进度、弹窗请求和任务结束通知，并批量显示缓冲的日志"""
+        try:
+            while True:
+                item = self.ui_queue.get_nowait()
+                kind = item[0]
+                if kind == "progress":
+                    self.show_progress(*item[1:])
+                elif kind == "call":
+                    _, func, args, reply = item
+                    try:
+                        reply.put((True, func(*args)))
+                    except Exception as e:
+                        reply.put((False, e))
+                elif kind == "done":
+                    _, on_done, result, error = item
+                    self.task_thread = None
+                    self.set_task_running(False)
+                    on_done(result, error)
+        except queue.Empty:
+            pass
+        self.flush_log()
+        self.root.after(100, self.poll_ui_queue)
+
+    def run_in_background(self, task, on_done):
         """
-        增强版CSV读取，优先使用utf-8-sig，兼容更多编码
+        在工作线程中执行task()，结束后在主线程调用on_done(result, error)
+        同一时间只允许一个批处理任务
         """
-        # 调整编码优先级：优先utf-8-sig，解决中文解码问题
-        encodings = [
-            'utf-8-sig', 'utf-8', 'gbk', 'gb2312', 'latin-1',
-            self.detect_encoding(file_path)  # 最后尝试检测的编码
-        ]
-        # 去重并过滤None
-        encodings = list(filter(None, list(dict.fromkeys(encodings))))
-
-        for enc in encodings:
+        if self.task_thread is not None:
+            messagebox.showinfo("提示", "已有任务正在运行，请等待完成或取消！")
+            return
+
+        def runner():
+            result, error = None, None
             try:
-                if is_full_read:
-                    df = pd.read_csv(file_path, encoding=enc, skiprows=skip_rows, on_bad_lines='skip')
-                else:
-                    df = pd.read_csv(file_path, encoding=enc, skiprows=skip_rows, nrows=0)
-                self.log(f"使用编码 {enc} 成功读取文件：{os.path.basename(file_path)}")
-                return df, enc
+                result = task()
             except Exception as e:
-                self.log(f"尝试编码 {enc} 读取失败：{str(e)[:100]}")  # 只打印前100字符，避免日志过长
-                continue
-        raise ValueError(f"无法读取文件（所有编码尝试失败）：{file_path}")
+                error = e
+                self.log(f"详细异常堆栈：{traceback.format_exc()}")
+            self.ui_queue.put(("done", on_done, result, error))
+
+        self.cancel_event.clear()
+        self.task_start_time = time.perf_counter()
+        self.set_task_running(True)
+        self.task_thread = threading.Thread(target=runner, daemon=True)
+        self.task_thread.start()
+
+    def set_task_running(self, running):
+        task_state = "disabled" if running else "normal"
+        self.start_button.config(state=task_state)
+        self.summary_button.config(state=task_state)
+        self.wide_table_button.config(state=task_state)
+        self.cancel_button.config(state="normal" if running else "disabled")
+        if running:
+            self.progress_bar["value"] = 0
+            self.progress_label.config(text="运行中...")
+
+    def report_progress(self, done, total, rows):
+        """引擎进度回调（工作线程中调用）"""
+        self.ui_queue.put(("progress", done, total, rows))
+
+    def show_progress(self, done, total, rows):
+        elapsed = max(time.perf_counter() - self.task_start_time, 1e-6)
+        self.progress_bar["maximum"] = max(total, 1)
+        self.progress_bar["value"] = done
+        self.progress_label.config(text=f"文件 {done}/{total}，已处理 {rows} 行，{rows / elapsed:.0f} 行/秒")
+
+    def cancel_task(self):
+        if self.task_thread is not None:
+            self.cancel_event.set()
+            self.cancel_button.config(state="disabled")
+            self.log("已请求取消，当前文件处理完后停止...")
 
     def select_files(self):
         files = filedialog.askopenfilenames(
@@ -210,19 +380,9 @@ class ScoreStatisticsApp:
         self.log(f"成功添加文件：{[os.path.basename(f) for f in new_files]}")
 
         first_file = new_files[0]
-        skip_rows = self.skip_header.get()
 
         try:
-            if first_file.endswith('.csv'):
-                df, encoding = self.try_read_csv(first_file, skip_rows)
-            else:
-                df = pd.read_excel(first_file, skiprows=skip_rows, nrows=0)
-                encoding = "excel"
-
-            columns = df.columns.tolist()
-            # 初始化file_info，避免后续KeyError
-            self.file_info[first_file] = {"columns": columns, "encoding": encoding, "processed_path": "",
-                                          "full_score": 0}
+            columns, _ = self.build_engine().read_columns(first_file)
 
             if not self.name_combobox['values']:
                 self.name_combobox['values'] = columns
@@ -230,6 +390,7 @@ class ScoreStatisticsApp:
                 self.score_combobox['values'] = columns
 
             self.auto_match_columns(columns)
+            self.scan_files(new_files)
 
         except Exception as e:
             self.log(f"读取文件列名失败：{str(e)}")
@@ -241,14 +402,16 @@ class ScoreStatisticsApp:
         if not folder:
             return
 
-        file_types = ('.csv', '.xlsx')
-        folder_files = [
-            os.path.join(folder, f)
-            for f in os.listdir(folder)
-            if f.lower().endswith(file_types)
-        ]
+        # 与命令行相同，跳过已生成的_统计后文件、汇总文件、成绩册和各种统计报告
+        try:
+            folder_files = load_engine().list_score_files(folder)
+        except Exception as e:
+            self.log(f"读取文件夹失败：{str(e)}")
+            self.log(f"详细异常：{traceback.format_exc()}")
+            messagebox.showerror("错误", f"读取文件夹失败：{str(e)}")
+            return
         if not folder_files:
-            messagebox.showwarning("提示", "该文件夹下没有CSV/XLSX文件！")
+            messagebox.showwarning("提示", "该文件夹下没有待统计的CSV/XLSX文件！")
             return
 
         new_files = [f for f in folder_files if f not in self.file_paths]
@@ -261,19 +424,9 @@ class ScoreStatisticsApp:
         self.log(f"成功添加文件夹下的文件：{[os.path.basename(f) for f in new_files]}")
 
         first_file = new_files[0]
-        skip_rows = self.skip_header.get()
 
         try:
-            if first_file.endswith('.csv'):
-                df, encoding = self.try_read_csv(first_file, skip_rows)
-            else:
-                df = pd.read_excel(first_file, skiprows=skip_rows, nrows=0)
-                encoding = "excel"
-
-            columns = df.columns.tolist()
-            # 初始化file_info
-            self.file_info[first_file] = {"columns": columns, "encoding": encoding, "processed_path": "",
-                                          "full_score": 0}
+            columns, _ = self.build_engine().read_columns(first_file)
 
             if not self.name_combobox['values']:
                 self.name_combobox['values'] = columns
@@ -281,21 +434,127 @@ class ScoreStatisticsApp:
                 self.score_combobox['values'] = columns
 
             self.auto_match_columns(columns)
+            self.scan_files(new_files)
 
         except Exception as e:
             self.log(f"读取文件夹文件列名失败：{str(e)}")
             self.log(f"详细异常：{traceback.format_exc()}")
             messagebox.showerror("错误", f"读取文件夹文件结构失败：{str(e)}")
 
+    def scan_files(self, file_paths, then=None):
+        """
+        后台并行扫描文件表头，按列名分组记录编码/列名/总分列/满分；
+        扫描完成后调用then()，没有then时若有文件存在问题，弹出「文件表头检查」窗口集中处理
+        """
+        if self.task_thread is not None:
+            self.log("任务运行中，新添加的文件将在开始统计前检查表头")
+            return
+        engine = self.build_engine()
+
+        def on_done(result, error):
+            if error is not None:
+                self.log(f"扫描文件表头失败：{error}")
+                return
+            self.scanned_paths.update(file_paths)
+            if then is not None:
+                then()
+            else:
+                issues = engine.schema_issues(self.file_paths)
+                if issues:
+                    self.fix_schema_issues(engine, issues)
+
+        self.run_in_background(lambda: engine.scan_files(file_paths), on_done)
+
+    def fix_schema_issues(self, engine, issues):
+        """
+        「文件表头检查」窗口：一次处理所有文件的表头问题，列名相同的文件为一组，
+        可为每组选择总分列、填写满分，缺少姓名/学号列或读取失败的组只能移除
+        :param issues: {文件路径: [问题, ...]}（engine.schema_issues的结果）
+        :return: 问题全部处理完返回True，取消返回False
+        """
+        groups = {}
+        for file_path in issues:
+            groups.setdefault(tuple(engine.file_schema(file_path)["columns"]), []).append(file_path)
+
+        result = False
+        top = tk.Toplevel(self.root)
+        top.title("文件表头检查")
+        top.transient(self.root)
+        top.grab_set()
+        ttk.Label(top, text=f"{len(issues)} 个文件的表头存在问题，列名相同的文件一起处理：").pack(padx=10, pady=10)
+        frame = ttk.Frame(top)
+        frame.pack(fill="x", padx=10)
+
+        rows = []  # [(文件路径列表, 总分列变量, 满分变量, 移除变量), ...]，不能修复的组没有前两个变量
+        for index, (columns, paths) in enumerate(groups.items()):
+            schema = engine.file_schema(paths[0])
+            names = "、".join(os.path.basename(path) for path in paths[:3]) + ("等" if len(paths) > 3 else "")
+            ttk.Label(frame, text=f"{len(paths)} 个文件（{names}）：{'；'.join(schema['issues'])}",
+                      wraplength=600).grid(row=index * 2, column=0, columnspan=5, sticky="w", pady=(8, 2))
+            fixable = engine.name_column in columns and engine.id_column in columns
+            remove_var = tk.BooleanVar(value=not fixable)
+            score_var = full_var = None
+            if fixable:
+                score_var = tk.StringVar(value=schema["score_column"] if schema["score_column"] in columns else "")
+                full_var = tk.StringVar(value="" if schema["full_score"] is None else f"{schema['full_score']:g}")
+                ttk.Label(frame, text="总分列：").grid(row=index * 2 + 1, column=0, sticky="e")
+                ttk.Combobox(frame, textvariable=score_var, values=list(columns), state="readonly",
+                             width=15).grid(row=index * 2 + 1, column=1, sticky="w")
+                ttk.Label(frame, text="满分：").grid(row=index * 2 + 1, column=2, sticky="e")
+                ttk.Entry(frame, textvariable=full_var, width=8).grid(row=index * 2 + 1, column=3, sticky="w")
+            ttk.Checkbutton(frame, text="移除这些文件", variable=remove_var).grid(row=index * 2 + 1, column=4, padx=10)
+            rows.append((paths, score_var, full_var, remove_var))
+
+        def on_confirm():
+            nonlocal result
+            removed = []
+            for paths, score_var, full_var, remove_var in rows:
+                if remove_var.get():
+                    removed.extend(paths)
+                    continue
+                if score_var is None:
+                    continue
+                text = full_var.get().strip()
+                try:
+                    full_score = float(text) if text else None
+                except ValueError:
+                    full_score = 0
+                if full_score is not None and full_score <= 0:
+                    messagebox.showwarning("警告", f"满分必须是大于0的数字：{text}", parent=top)
+                    return
+                for path in paths:
+                    if score_var.get():
+                        engine.file_info[path]["score_column"] = score_var.get()
+                    if full_score is not None:
+                        engine.full_scores[path] = self.full_scores[path] = full_score
+
+            remaining = engine.schema_issues([path for path in issues if path not in removed])
+            if remaining:
+                detail = "\n".join(f"{os.path.basename(path)}：{'；'.join(items)}" for path, items in remaining.items())
+                messagebox.showwarning("警告", f"以下文件仍有问题，请处理或移除：\n{detail}", parent=top)
+                return
+            if removed:
+                self.file_paths = [path for path in self.file_paths if path not in removed]
+                self.file_label.config(text=f"已选 {len(self.file_paths)} 个文件")
+                self.log(f"已移除表头有问题的文件：{[os.path.basename(path) for path in removed]}")
+            self.log("文件表头问题已全部处理")
+            result = True
+            top.destroy()
+
+        btn_frame = ttk.Frame(top)
+        btn_frame.pack(pady=10)
+        ttk.Button(btn_frame, text="确认", command=on_confirm).pack(side="left", padx=10)
+        ttk.Button(btn_frame, text="取消", command=top.destroy).pack(side="left", padx=10)
+
+        self.root.wait_window(top)
+        return result
+
     def auto_match_columns(self, columns):
-        for col in columns:
-            col_str = str(col).strip()
-            if not self.name_column_var.get() and (col_str == "Unnamed: 1" or "姓名" in col_str):
-                self.name_column_var.set(col_str)
-            if not self.id_column_var.get() and (col_str == "Unnamed: 2" or "学号" in col_str):
-                self.id_column_var.set(col_str)
-            if not self.score_column_var.get() and (col_str == "Unnamed: 4" or "总分" in col_str):
-                self.score_column_var.set(col_str)
+        name_col, id_col, score_col = load_engine().match_columns(columns)
+        for var, matched in ((self.name_column_var, name_col), (self.id_column_var, id_col),
+                             (self.score_column_var, score_col)):
+            if not var.get() and matched:
+                var.set(matched)
 
         self.log(
             f"自动匹配列名：姓名列={self.name_column_var.get()}, 学号列={self.id_column_var.get()}, 总分列={self.score_column_var.get()}")
@@ -348,53 +607,54 @@ class ScoreStatisticsApp:
                 messagebox.showerror("错误", f"第{i + 1}个分数段：请输入有效的数字！")
                 return False
 
-        self.log(f"得分率-分数段规则：{self.score_segments}")
         return True
 
-    def extract_full_score(self, score_column_name, file_name):
-        """
-        从总分列名提取满分，兼容更多格式
-        """
-        # 扩展正则匹配规则
-        patterns = [
-            r'总分\((\d+\.?\d*)\)',  # 总分(80)、总分(80.0)
-            r'总分\((\d+\.?\d*),',  # 总分(80,排名)
-            r'总分[^\d]*(\d+\.?\d*)',  # 总分80、总分_80分
-        ]
-
-        for pattern in patterns:
-            match = re.search(pattern, score_column_name)
-            if match:
-                full_score = float(match.group(1))
-                self.log(f"从列名「{score_column_name}」提取到{file_name}的满分：{full_score}")
-                return full_score
-
-        # 正则匹配失败，使用自定义弹窗输入
-        full_score = self.custom_ask_float("输入满分",
-                                           f"无法从列名「{score_column_name}」提取{file_name}的满分，请输入（如80、100）：")
-        if full_score is None:  # 用户取消
-            raise ValueError("用户取消满分输入")
-        return full_score
-
-    def clean_score(self, score_value):
-        if pd.isna(score_value) or score_value == '' or str(score_value).strip() in ['未开考', '缺考']:
-            return 0.0
+    def parse_rule_set_text(self):
+        """解析对比规则输入框，每个非空行一套规则"""
+        lines = [line for line in self.rule_set_text.get("1.0", "end").splitlines() if line.strip()]
         try:
-            num_str = re.search(r'(\d+\.?\d*)', str(score_value))
-            if num_str:
-                return float(num_str.group(1))
-            else:
-                return 0.0
-        except:
-            return 0.0
-
-    def get_assigned_score_by_rate(self, rate):
-        """按得分率匹配分数段"""
-        rate = max(0.0, min(1.0, rate))
-        for min_rate, max_rate, assign_score in self.score_segments:
-            if min_rate <= rate <= max_rate:
-                return assign_score
-        return 0.0
+            self.rule_sets = load_engine().parse_rule_sets(lines)
+        except ValueError as e:
+            messagebox.showwarning("警告", str(e))
+            return False
+        return True
+
+    def ask_full_score(self, score_column_name, file_name):
+        return self.call_in_main_thread(
+            self.custom_ask_float, "输入满分",
+            f"无法从列名「{score_column_name}」提取{file_name}的满分，请输入（如80、100）：")
+
+    def gradebook_path(self):
+        """勾选「写入成绩库」时成绩库放在第一个成绩文件所在目录，否则为空"""
+        if not self.gradebook_var.get() or not self.file_paths:
+            return ""
+        return os.path.join(os.path.dirname(self.file_paths[0]), load_engine().GRADEBOOK_FILE_NAME)
+
+    def build_engine(self, score_segments=None):
+        """按当前界面设置创建统计引擎，file_info与界面共享"""
+        return load_engine().ScoreEngine(
+            name_column=self.name_column_var.get(),
+            id_column=self.id_column_var.get(),
+            score_column=self.score_column_var.get(),
+            score_segments=score_segments,
+            skip_rows=self.skip_header.get(),
+            log=self.log,
+            ask_full_score=self.ask_full_score,
+            file_info=self.file_info,
+            results=self.file_results,
+            full_scores=dict(self.full_scores),
+            workers=self.worker_count.get(),
+            progress=self.report_progress,
+            cancel_event=self.cancel_event,
+            incremental=self.incremental_var.get(),
+            chunk_size=self.chunk_size.get(),
+            compact_output=self.compact_output_var.get(),
+            output_format="" if self.output_format_var.get() == SAME_FORMAT else self.output_format_var.get(),
+            db_path=self.gradebook_path(),
+            timing_report=self.timing_report_var.get(),
+            verbose=self.verbose_log_var.get(),
+            csv_engine=self.csv_engine_var.get(),
+        )
 
     def start_statistics(self):
         if not self.file_paths:
@@ -406,65 +666,38 @@ class ScoreStatisticsApp:
             messagebox.showwarning("警告", "请选择姓名列、学号列、总分列！")
             return
 
-        if not self.parse_segment_rules():
+        if not self.parse_segment_rules() or not self.parse_rule_set_text():
             return
 
-        self.processed_paths = []
-        for file_path in self.file_paths:
-            try:
-                filename = os.path.basename(file_path)
-                skip_rows = self.skip_header.get()
-                self.log(f"开始处理文件：{filename}（跳过{skip_rows}行）")
-
-                # 初始化当前文件的file_info，避免KeyError
-                if file_path not in self.file_info:
-                    self.file_info[file_path] = {"columns": [], "encoding": "", "processed_path": "", "full_score": 0}
-
-                # 读取文件
-                if file_path.endswith('.csv'):
-                    df, encoding = self.try_read_csv(file_path, skip_rows, is_full_read=True)
-                    self.file_info[file_path]["encoding"] = encoding  # 现在赋值不会KeyError
-                else:
-                    df = pd.read_excel(file_path, skiprows=skip_rows)
-                    self.file_info[file_path]["encoding"] = "excel"
-
-                # 提取该文件的满分
-                full_score = self.extract_full_score(self.score_column_var.get(), filename)
-                self.file_info[file_path]["full_score"] = full_score
-                self.log(f"文件 {filename} 的总分满分为：{full_score}")
-
-                # 检查核心列
-                for col in required_cols:
-                    if col not in df.columns:
-                        raise ValueError(f"缺少核心列：{col}")
-
-                # 计算得分率+统计分
-                df['实际得分'] = df[self.score_column_var.get()].apply(self.clean_score)
-                df['得分率'] = df['实际得分'] / full_score
-                df['统计分'] = df['得分率'].apply(self.get_assigned_score_by_rate)
-                self.log(f"文件 {filename}：统计分计算完成，共 {len(df)} 条数据")
-
-                # 保存文件
-                save_path = file_path.replace('.csv', '_统计后.csv') if file_path.endswith(
-                    '.csv') else file_path.replace('.xlsx', '_统计后.xlsx')
-                if file_path.endswith('.csv'):
-                    # 保存时用utf-8-sig，避免中文乱码
-                    df.to_csv(save_path, index=False, encoding='utf-8-sig')
-                else:
-                    df.to_excel(save_path, index=False)
-
-                self.file_info[file_path]["processed_path"] = save_path
-                self.processed_paths.append(save_path)
-                self.log(f"文件 {filename} 已保存为：{os.path.basename(save_path)}")
-
-            except Exception as e:
-                error_msg = f"处理 {filename} 失败：{str(e)}"
-                self.log(error_msg)
-                self.log(f"详细异常堆栈：{traceback.format_exc()}")
-                messagebox.showerror("处理错误", error_msg)
+        # 开始处理前检查所有文件的表头：未扫描的先扫描，有问题的在一个窗口中集中处理
+        unscanned = [path for path in self.file_paths if path not in self.scanned_paths]
+        if unscanned:
+            self.scan_files(unscanned, then=self.start_statistics)
+            return
+        engine = self.build_engine(self.score_segments)
+        engine.set_rule_sets(self.rule_sets)
+        issues = engine.schema_issues(self.file_paths)
+        if issues and not self.fix_schema_issues(engine, issues):
+            return
+        if not self.file_paths:
+            messagebox.showwarning("警告", "没有可处理的文件！")
+            return
+        file_paths = list(self.file_paths)
+
+        def on_done(processed_paths, error):
+            if error is not None:
+                messagebox.showerror("处理错误", f"统计任务异常结束：{error}")
+                return
+            self.processed_paths = processed_paths
+            if engine.errors:
+                failed = "\n".join(msg for _, msg in engine.errors)
+                messagebox.showerror("处理错误", f"以下 {len(engine.errors)} 个文件处理失败：\n{failed}")
+            if engine.cancelled:
+                messagebox.showinfo("已取消", f"任务已取消，已完成 {len(processed_paths)} 个文件！")
+            else:
+                messagebox.showinfo("完成", "所有文件统计分添加完成！")
 
-        messagebox.showinfo("完成", "所有文件统计分添加完成！")
-        self.log("=== 统计分添加任务全部结束 ===")
+        self.run_in_background(lambda: engine.start_statistics(file_paths), on_done)
 
     def summary_total_score(self):
         if not self.processed_paths:
@@ -476,86 +709,89 @@ class ScoreStatisticsApp:
             messagebox.showwarning("警告", "请选择姓名列、学号列！")
             return
 
-        total_score_dict = defaultdict(float)
-        file_count = 0
-
-        for processed_path in self.processed_paths:
-            try:
-                filename = os.path.basename(processed_path)
-                skip_rows = self.skip_header.get()
-                self.log(f"汇总文件：{filename}（跳过{skip_rows}行）")
-
-                # 汇总阶段也使用增强版的try_read_csv读取文件，自动适配编码
-                if processed_path.endswith('.csv'):
-                    df, _ = self.try_read_csv(processed_path, skip_rows, is_full_read=True)
-                else:
-                    df = pd.read_excel(processed_path, skiprows=skip_rows)
-
-                if '统计分' not in df.columns:
-                    raise ValueError("文件中无「统计分」列，请先执行「开始统计」！")
-
-                file_count += 1
-                self.log(f"汇总 {filename}：{len(df)} 条数据")
-
-                name_col = self.name_column_var.get()
-                id_col = self.id_column_var.get()
-
-                for _, row in df.iterrows():
-                    name = str(row[name_col]).strip() if not pd.isna(row[name_col]) else "未知姓名"
-                    student_id = str(row[id_col]).strip() if not pd.isna(row[id_col]) else "未知学号"
-                    stat_score = float(row['统计分']) if not pd.isna(row['统计分']) else 0.0
-
-                    total_score_dict[(name, student_id)] += stat_score
-
-            except Exception as e:
-                error_msg = f"汇总 {filename} 失败：{str(e)}"
-                self.log(error_msg)
-                self.log(f"详细异常堆栈：{traceback.format_exc()}")
-                messagebox.showerror("汇总错误", error_msg)
-
-        if not total_score_dict:
-            messagebox.showwarning("警告", "无有效数据可汇总！")
+        engine = self.build_engine()
+        if self.rule_sets:  # 并列汇总上次统计使用的对比规则
+            engine.set_segments(self.score_segments, report=False)
+            engine.set_rule_sets(self.rule_sets, report=False)
+        processed_paths = list(self.processed_paths)
+
+        def on_done(result, error):
+            if engine.errors:
+                failed = "\n".join(msg for _, msg in engine.errors)
+                messagebox.showerror("汇总错误", f"以下 {len(engine.errors)} 个文件汇总失败：\n{failed}")
+            if error is not None:
+                messagebox.showwarning("警告", str(error))
+                return
+            _, summary_path, file_count = result
+            messagebox.showinfo("汇总完成", f"成功汇总 {file_count} 个文件！\n汇总文件路径：\n{summary_path}")
+
+        self.run_in_background(lambda: engine.summary_total_score(processed_paths), on_done)
+
+    def export_wide_table(self):
+        """导出成绩册宽表（每名学生一行、每个作业一列），格式同汇总文件（Parquet/Feather或CSV）"""
+        if not self.processed_paths:
+            messagebox.showwarning("警告", "请先执行「开始统计」生成处理后的文件！")
             return
 
-        summary_data = []
-        for (name, student_id), total_score in total_score_dict.items():
-            summary_data.append({
-                "姓名": name,
-                "学号": student_id,
-                "参与文件数": file_count,
-                "统计分总分": round(total_score, 2)
-            })
-
-        summary_df = pd.DataFrame(summary_data)
-        summary_df = summary_df.sort_values("统计分总分", ascending=False).reset_index(drop=True)
+        engine = self.build_engine()
+        processed_paths = list(self.processed_paths)
+        values = ['统计分', '实际得分', '得分率'] if self.wide_raw_var.get() else ['统计分']
 
-        summary_dir = os.path.dirname(self.processed_paths[0])
-        summary_path = os.path.join(summary_dir, "成绩统计总分汇总.csv")
-        # 汇总文件用utf-8-sig保存，避免中文乱码
-        summary_df.to_csv(summary_path, index=False, encoding='utf-8-sig')
+        def on_done(result, error):
+            if engine.errors:
+                failed = "\n".join(msg for _, msg in engine.errors)
+                messagebox.showerror("导出错误", f"以下 {len(engine.errors)} 个文件读取失败：\n{failed}")
+            if error is not None:
+                messagebox.showwarning("警告", str(error))
+                return
+            wide_df, wide_path = result
+            messagebox.showinfo("导出完成", f"成绩册共 {len(wide_df)} 名学生！\n文件路径：\n{wide_path}")
 
-        self.log(f"汇总完成！共 {len(summary_df)} 名学生，汇总文件已保存至：{summary_path}")
-        messagebox.showinfo("汇总完成", f"成功汇总 {file_count} 个文件！\n汇总文件路径：\n{summary_path}")
+        self.run_in_background(lambda: engine.export_wide_table(processed_paths, values=values), on_done)
 
     def log(self, msg):
+        """任意线程都可调用：写入日志文件，并放入缓冲区等待主线程的flush_log批量显示"""
         time_str = datetime.now().strftime("[%H:%M:%S]")
-        self.log_text.insert(tk.END, f"{time_str} {msg}\n")
+        self.log_lines.append(f"{time_str} {msg}")
+        if self.file_log:
+            self.file_log.info(msg)
+        elif self.file_log is None:
+            self.file_log_backlog.append(msg)
+
+    def flush_log(self):
+        """把缓冲区中的日志一次性插入日志框并滚动到底部，日志框只保留最后LOG_MAX_LINES行"""
+        if not self.log_lines:
+            return
+        lines = [self.log_lines.popleft() for _ in range(len(self.log_lines))]
+        self.log_text.insert(tk.END, "\n".join(lines) + "\n")
+        extra = int(self.log_text.index("end-1c").split(".")[0]) - 1 - LOG_MAX_LINES
+        if extra > 0:
+            self.log_text.delete("1.0", f"{extra + 1}.0")
         self.log_text.see(tk.END)
-        self.root.update_idletasks()
 
     def clear_log(self):
+        self.log_lines.clear()
         self.log_text.delete(1.0, tk.END)
         self.log("日志已清空")
 
     def reset_all(self):
+        if self.task_thread is not None:
+            messagebox.showinfo("提示", "任务运行中，请等待完成或取消后再重置！")
+            return
+
         # 1. 重置文件相关状态
         self.file_paths = []
         self.processed_paths = []
         self.file_info = {}
+        self.scanned_paths = set()
+        self.file_results = {}
+        self.full_scores = {}
         self.file_label.config(text="未选择文件")
 
         # 2. 重置分数段相关状态
         self.score_segments = []
+        self.rule_sets = {}
+        self.rule_set_text.delete("1.0", "end")
         self.segment_count.set(0)
         # 销毁分数段输入框
         for widget in self.segment_frame.winfo_children():
@@ -563,6 +799,16 @@ class ScoreStatisticsApp:
 
         # 3. 重置列选择/表头跳过行数
         self.skip_header.set(0)
+        self.worker_count.set(1)
+        self.incremental_var.set(False)
+        self.chunk_size.set(0)
+        self.compact_output_var.set(False)
+        self.output_format_var.set(SAME_FORMAT)
+        self.csv_engine_var.set("auto")
+        self.gradebook_var.set(False)
+        self.timing_report_var.set(False)
+        self.verbose_log_var.set(False)
+        self.wide_raw_var.set(False)
         self.name_column_var.set("")
         self.id_column_var.set("")
         self.score_column_var.set("")
@@ -576,6 +822,7 @@ class ScoreStatisticsApp:
 
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()  # 打包为exe后进程池子进程需要
     print("=== 通用成绩统计工具 ===")
     print("运行前请确保已安装依赖：pip install pandas openpyxl chardet")
     print("你的文件表头跳过行数设为0，列名会自动匹配Unnamed:1（姓名）、Unnamed:2（学号）、Unnamed:4（总分）")